@@ -0,0 +1,266 @@
+"""
+Audio Analysis Module
+Measures each track's peak, RMS and loudness and draws a small waveform of it, for volume levelling
+and the seek bar. Tracks are decoded a few seconds at a time (WAV directly, anything else through
+ffmpeg if it's installed) and crunched with NumPy in worker processes, so memory stays the same for
+an hour-long file. Results are a few hundred bytes per track, kept in .analysis_cache/.
+Without NumPy nothing is analyzed and every track plays at full volume. NumPy is only imported by the worker
+processes, so it doesn't slow down opening the window.
+"""
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor, wait as wait_for
+from concurrent.futures.process import BrokenProcessPool
+from PySide6.QtCore import QObject, Signal
+
+numpy = None # Imported by _import_numpy() in the worker processes
+
+BLOCK_SECONDS = 0.1        # Peak and power are kept per block of this length
+READ_BLOCKS = 50           # Blocks decoded at a time
+WAVEFORM_POINTS = 400
+TARGET_LOUDNESS_DB = -18.0 # Louder tracks are turned down to this; quieter ones can't be turned up
+SILENCE_DB = -70.0         # Blocks quieter than this don't count towards loudness
+FFMPEG_RATE = 22050        # Mono sample rate ffmpeg decodes to; plenty for levels and a waveform
+MAX_POOL_RESTARTS = 3      # Worker pools that may die before analysis is turned off for the session
+_HEADER = struct.Struct("<4sfffH") # magic, peak, rms, loudness, waveform length
+_MAGIC = b"ANA1"
+
+def numpy_available():
+    """Whether NumPy is installed, without importing it."""
+    return importlib.util.find_spec("numpy") is not None
+
+def _import_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as numpy_module
+        except ImportError:
+            raise ValueError("NumPy is not installed")
+        numpy = numpy_module
+
+class TrackAnalysis:
+    __slots__ = ('peak', 'rms', 'loudness_db', 'waveform')
+
+    def __init__(self, peak, rms, loudness_db, waveform):
+        self.peak = peak               # 0..1 of full scale
+        self.rms = rms
+        self.loudness_db = loudness_db # dB below full scale, gated over 400 ms windows (not K-weighted)
+        self.waveform = waveform       # bytes, peak per slice of the track scaled to 0..255
+
+    def gain(self, target_db=TARGET_LOUDNESS_DB):
+        """Volume (0..1) that brings the track down to target_db."""
+        if self.loudness_db <= SILENCE_DB: return 1.0
+        return min(1.0, 10 ** ((target_db - self.loudness_db) / 20))
+
+    def to_bytes(self):
+        return _HEADER.pack(_MAGIC, self.peak, self.rms, self.loudness_db, len(self.waveform)) + self.waveform
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, peak, rms, loudness_db, length = _HEADER.unpack_from(data)
+        if magic != _MAGIC: raise ValueError("not an analysis file")
+        return cls(peak, rms, loudness_db, bytes(data[_HEADER.size:_HEADER.size + length]))
+
+# --- Decoding ---
+
+def _wav_chunks(path):
+    """(sample rate, iterator of float32 arrays shaped (frames, channels))."""
+    wav = wave.open(path, 'rb')
+    channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+    read_frames = max(1, int(rate * BLOCK_SECONDS)) * READ_BLOCKS
+
+    def chunks():
+        with wav:
+            while True:
+                raw = wav.readframes(read_frames)
+                if not raw: return
+                yield _pcm_to_float(raw, width).reshape(-1, channels)
+    return rate, chunks()
+
+def _pcm_to_float(raw, width):
+    if width == 1: return (numpy.frombuffer(raw, numpy.uint8).astype(numpy.float32) - 128) / 128
+    if width == 2: return numpy.frombuffer(raw, '<i2').astype(numpy.float32) / 32768
+    if width == 3:
+        b = numpy.frombuffer(raw, numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+        return ((b[:, 2] << 24 | b[:, 1] << 16 | b[:, 0] << 8) >> 8).astype(numpy.float32) / 8388608
+    if width == 4: return numpy.frombuffer(raw, '<i4').astype(numpy.float32) / 2147483648
+    raise ValueError(f"unsupported WAV sample width {width}")
+
+def _ffmpeg_chunks(path):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None: raise ValueError("only WAV files can be analyzed without ffmpeg")
+    read_bytes = int(FFMPEG_RATE * BLOCK_SECONDS) * READ_BLOCKS * 2
+
+    def chunks():
+        process = subprocess.Popen([ffmpeg, "-v", "error", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(FFMPEG_RATE), "-"],
+                                   stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                raw = process.stdout.read(read_bytes)
+                if not raw: break
+                yield _pcm_to_float(raw[:len(raw) // 2 * 2], 2).reshape(-1, 1)
+        finally:
+            process.stdout.close()
+            if process.wait() != 0: raise ValueError(f"ffmpeg could not decode {path}")
+    return FFMPEG_RATE, chunks()
+
+# --- Analysis ---
+
+def analyze_file(path):
+    """Decodes path a few seconds at a time and returns its TrackAnalysis. Raises OSError or ValueError."""
+    _import_numpy()
+    try:
+        rate, chunks = _wav_chunks(path)
+    except (wave.Error, EOFError):
+        rate, chunks = _ffmpeg_chunks(path)
+    block = max(1, int(rate * BLOCK_SECONDS))
+    powers, peaks = [], []
+    carry = None
+    for chunk in chunks:
+        if carry is not None: chunk = numpy.concatenate((carry, chunk))
+        whole = len(chunk) // block * block
+        if whole:
+            blocks = chunk[:whole].reshape(whole // block, -1) # One row per block, all channels
+            powers.append(numpy.square(blocks).mean(axis=1))
+            peaks.append(numpy.abs(blocks).max(axis=1))
+        carry = chunk[whole:]
+    if carry is not None and len(carry):
+        powers.append(numpy.array([numpy.square(carry).mean()]))
+        peaks.append(numpy.array([numpy.abs(carry).max()]))
+    if not powers: raise ValueError("no audio")
+    powers = numpy.concatenate(powers).astype(numpy.float64)
+    peaks = numpy.concatenate(peaks)
+    return TrackAnalysis(float(peaks.max()), float(numpy.sqrt(powers.mean())), _gated_loudness(powers), _waveform(peaks))
+
+def _gated_loudness(powers):
+    # 400 ms windows overlapping by 75%, an absolute gate at SILENCE_DB and a relative one 10 dB under the rest
+    if len(powers) >= 4: windows = numpy.convolve(powers, numpy.full(4, 0.25), 'valid')
+    else: windows = numpy.array([powers.mean()])
+    loud = windows[windows > 10 ** (SILENCE_DB / 10)]
+    if not len(loud): return SILENCE_DB
+    loud = loud[loud > loud.mean() / 10]
+    return float(10 * numpy.log10(loud.mean()))
+
+def _waveform(peaks):
+    points = min(WAVEFORM_POINTS, len(peaks))
+    edges = numpy.linspace(0, len(peaks), points, endpoint=False).astype(numpy.int64)
+    return (numpy.minimum(numpy.maximum.reduceat(peaks, edges), 1.0) * 255).astype(numpy.uint8).tobytes()
+
+def _cache_name(path, stat):
+    return hashlib.sha1(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8')).hexdigest() + ".ana"
+
+def _analyze_and_store(path, cache_dir):
+    # Runs in a worker process
+    analysis = analyze_file(path)
+    data = analysis.to_bytes()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        name = os.path.join(cache_dir, _cache_name(path, os.stat(path)))
+        with open(name + ".tmp", 'wb') as file:
+            file.write(data)
+        os.replace(name + ".tmp", name)
+    except OSError as e:
+        print(f"Could not cache the analysis of {path}: {e}")
+    return data
+
+class AudioAnalyzer(QObject):
+    """
+    request(path) hands back a cached analysis right away, or starts one in the background and
+    emits analyzed(path, analysis) when it's done. Cache files are keyed by path, size and mtime.
+    """
+    analyzed = Signal(str, object) # path, TrackAnalysis
+
+    def __init__(self, cache_dir=".analysis_cache", workers=2):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock() # _pending is also cleared from the pool's result thread
+        self._pending = {} # path -> Future
+        self._failed = set()
+        self._memory = {} # path -> TrackAnalysis, for songs already asked about this session
+        self._enabled = numpy_available()
+        self._restarts = 0
+
+    def cached(self, path):
+        analysis = self._memory.get(path)
+        if analysis is not None: return analysis
+        try:
+            name = os.path.join(self.cache_dir, _cache_name(path, os.stat(path)))
+            with open(name, 'rb') as file:
+                analysis = TrackAnalysis.from_bytes(file.read())
+        except (OSError, ValueError, struct.error):
+            return None
+        self._memory[path] = analysis
+        return analysis
+
+    def request(self, path, wait=0.0):
+        """
+        The analysis of path if it's cached, otherwise None (and it's analyzed in the background).
+        With wait, gives an analysis that was already under way up to that many seconds to finish first.
+        One this call starts isn't waited for: decoding a whole song takes far longer than any wait worth making.
+        """
+        if not path: return None
+        analysis = self.cached(path)
+        if analysis is not None or not self._enabled: return analysis
+        with self._lock:
+            if path in self._failed: return None
+            future = self._pending.get(path)
+        if future is None:
+            self._submit(path)
+            return None
+        if not wait: return None
+        wait_for([future], timeout=wait)
+        # _finished may not have run yet, so read the result here
+        if not future.done() or future.cancelled() or future.exception() is not None: return None
+        return TrackAnalysis.from_bytes(future.result())
+
+    def _submit(self, path):
+        if self._pool is None:
+            # Spawned rather than forked: forking a process that runs Qt threads isn't safe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            future = self._pool.submit(_analyze_and_store, path, self.cache_dir)
+        except RuntimeError as e: # BrokenProcessPool: a worker died, the pool takes no more work
+            self._restart_pool(e)
+            return None # The song plays unlevelled; it's tried again next time it comes up
+        with self._lock:
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._finished(path, done))
+        return future
+
+    def _restart_pool(self, error):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None # A new one is started by the next request()
+        self._restarts += 1
+        if self._restarts > MAX_POOL_RESTARTS:
+            self._enabled = False
+            print(f"Audio analysis stopped, its worker processes keep dying ({error})")
+        else:
+            print(f"Audio analysis workers died ({error}), starting new ones")
+
+    def _finished(self, path, future):
+        # Runs on the pool's result thread; the signal is delivered on the GUI thread
+        with self._lock:
+            self._pending.pop(path, None)
+            if future.cancelled(): return
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool): return # Not the file's fault, request() restarts the pool
+            if error is not None:
+                self._failed.add(path) # Not retried this session
+                print(f"Could not analyze {path}: {error}")
+                return
+        analysis = TrackAnalysis.from_bytes(future.result())
+        self._memory[path] = analysis
+        self.analyzed.emit(path, analysis)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,42 +1,114 @@
 """
 Audio Player Module (Pygame Version)
 Updated with Shuffle functionality.
+The mixer itself lives on the PlaybackEngine thread; this class keeps the queue and state for the GUI.
 """
 
-import pygame
-import random
+import time
+from collections import deque
 from PySide6.QtCore import QObject, Signal
 
+from playback_engine import PlaybackEngine
+from shuffle import LazyShuffle
+
+SHUFFLE_LOOKAHEAD = 20 # Songs of a shuffle kept in the queue ("Up Next"); the rest are picked as they're needed
+LEVEL_WAIT = 0.2       # Seconds a song played right away may wait for its analysis (songs announced in advance needn't)
+RADIO_BATCH = 5        # Songs the radio queues at a time once the queue runs dry
+RADIO_SEEDS = 3        # Songs (the current one and those before it) the radio's picks are based on
+RADIO_MEMORY = 200     # Songs played this recently aren't picked again
+
 class AudioPlayer(QObject):
     # Signals
     current_song_changed = Signal(object) 
-    queue_changed = Signal(list)
     playback_state_changed = Signal(bool)
+    # Queue changes are reported as deltas so the sidebar never rebuilds the whole list
+    queue_reset = Signal(object)         # the new queue (only for play_list/shuffle)
+    queue_inserted = Signal(int, object) # first row, list of songs
+    queue_removed = Signal(int, int)     # first row, count
+    queue_moved = Signal(int, int)       # from row, to row
+    song_listened = Signal(object, float) # song, fraction heard; when it ends, is skipped or stopped
 
-    def __init__(self):
+    def __init__(self, pcm_cache=None, analyzer=None):
         super().__init__()
-        try:
-            pygame.mixer.init(frequency=44100) 
-        except Exception as e:
-            print(f"Error initializing Pygame mixer: {e}")
-            
-        self.queue = []
+        self.queue = deque() # Popped from the front, so a deque keeps that O(1)
         self.history = []
         self.current_song = None
         self.is_playing = False 
         self.is_paused = False
         self.current_pos_offset = 0.0 
+        self.resumed_at = None # perf_counter() when audio last (re)started, None while paused/stopped
+        self.announced_next = None # What the engine was last told comes after the current song
+        self.shuffle = None # LazyShuffle that refills the queue, while playing shuffled
+        self.radio = None   # similarity.SimilarityIndex that refills an empty queue, while the radio is on
         
-        self.SONG_END = pygame.USEREVENT + 1
-        pygame.mixer.music.set_endevent(self.SONG_END)
+        self.engine = PlaybackEngine(pcm_cache=pcm_cache)
+        self.engine.started.connect(self.on_engine_started)
+        self.engine.failed.connect(self.on_engine_failed)
+        self.engine.finished.connect(self.on_engine_finished)
+        self.engine.advanced.connect(self.on_engine_advanced)
+        # Optional audio_analysis.AudioAnalyzer; with one, every song is levelled to the same loudness
+        self.analyzer = analyzer
+        if analyzer is not None: analyzer.analyzed.connect(self.on_song_analyzed)
+        # The engine thread (and pygame) starts on the first command, or earlier through start_engine()
+
+    def start_engine(self):
+        """Gets pygame and the mixer ready in the background so the first play doesn't wait for them."""
+        self.engine.start()
+
+    def shutdown(self):
+        for command, (count, average, worst) in sorted(self.engine.latency_stats().items()):
+            print(f"{command}: {count} commands, {average:.1f} ms average, {worst:.1f} ms worst")
+        self.report_listened()
+        if self.analyzer is not None: self.analyzer.shutdown()
+        gaps = self.engine.gap_stats()
+        if gaps: print(f"Track gaps: {gaps[0]} transitions, {gaps[1]:.1f} ms average, {gaps[2]:.1f} ms worst")
+        self.engine.shutdown()
+
+    def on_engine_started(self, song, offset, started_at):
+        if song is not self.current_song: return # A newer command already replaced it
+        self.current_pos_offset = offset
+        if not self.is_paused: self.resumed_at = started_at
+
+    def on_engine_failed(self, song, error):
+        print(f"Error: {error}")
+        if song is not self.current_song: return
+        self.is_playing = False
+        self.is_paused = False
+        self.resumed_at = None
+        self.announced_next = None # The engine drops its next song along with the failed one
+        self.playback_state_changed.emit(False)
+
+    def announce_next(self):
+        """Tells the engine which song follows the current one so it can prefetch it and switch without a gap."""
+        next_song = self.queue[0] if self.queue and self.current_song and (self.is_playing or self.is_paused) else None
+        if next_song is not self.announced_next:
+            self.announced_next = next_song
+            if next_song is not None: self.level(next_song) # Before the engine can switch to it
+            self.engine.submit("set_next", next_song)
+
+    def level(self, song, wait=0.0):
+        """
+        Sends the engine the song's levelling volume before it starts, if it has been analyzed (or is within
+        wait seconds of it), otherwise has it analyzed for next time. The engine never changes the volume mid-song.
+        """
+        if self.analyzer is None: return
+        analysis = self.analyzer.request(song.filepath, wait)
+        if analysis is not None: self.engine.submit("set_gain", song.filepath, analysis.gain())
+
+    def on_song_analyzed(self, path, analysis):
+        # Only the song lined up next can still use it; a song already playing keeps its volume
+        song = self.announced_next
+        if song is not None and song.filepath == path:
+            self.engine.submit("set_gain", path, analysis.gain())
 
     def play_now(self, song):
         """Clears queue and plays a single song immediately."""
         self.stop()
-        self.queue = []
-        self.queue.append(song)
-        self.play_next_from_queue()
-        self.queue_changed.emit(self.queue)
+        self.shuffle = None
+        if self.queue:
+            self.queue_removed.emit(0, len(self.queue))
+            self.queue.clear()
+        self.add_to_queue(song)
 
     def play_list(self, songs, start_index=0):
         """
@@ -44,90 +116,175 @@ class AudioPlayer(QObject):
         This is used for "Play Album".
         """
         self.stop()
-        self.queue = list(songs) # Make a copy
-        
-        # If start_index is > 0, we need to pop the first few
-        # But usually for "Play Album", we start at 0.
-        # If we want to play track 1 immediately:
+        self.shuffle = None
+        self.queue = deque(songs) # Make a copy
+        for _ in range(min(start_index, len(self.queue))): self.queue.popleft()
+        self.queue_reset.emit(self.queue)
         if self.queue:
             self.play_next_from_queue()
-            
-        self.queue_changed.emit(self.queue)
 
     def add_to_queue(self, song):
         self.queue.append(song)
-        self.queue_changed.emit(self.queue)
+        self.queue_inserted.emit(len(self.queue) - 1, [song])
         if not self.is_playing and not self.is_paused:
             self.play_next_from_queue()
+        else:
+            self.announce_next()
+
+    def remove_from_queue(self, row):
+        if 0 <= row < len(self.queue):
+            del self.queue[row]
+            self.queue_removed.emit(row, 1)
+            self.announce_next()
+
+    def move_in_queue(self, from_row, to_row):
+        if from_row == to_row or not (0 <= from_row < len(self.queue) and 0 <= to_row < len(self.queue)): return
+        song = self.queue[from_row]
+        del self.queue[from_row]
+        self.queue.insert(to_row, song)
+        self.queue_moved.emit(from_row, to_row)
+        self.announce_next()
+
+    def play_shuffled(self, songs, seed=None, weighted=False):
+        """
+        Plays songs in a random order. Only SHUFFLE_LOOKAHEAD of them are queued at a time, so starting
+        doesn't depend on how many there are; songs is not copied, so pass a sequence that won't change meanwhile
+        (e.g. a tuple). See shuffle.LazyShuffle for the options.
+        """
+        self.stop()
+        self.shuffle = LazyShuffle(songs, seed=seed, weighted=weighted)
+        self.queue = deque(self.shuffle.take(SHUFFLE_LOOKAHEAD))
+        self.queue_reset.emit(self.queue)
+        if self.queue:
+            self.play_next_from_queue()
 
     def shuffle_queue(self):
-        """Shuffles the current queue."""
-        random.shuffle(self.queue)
-        self.queue_changed.emit(self.queue)
-
-    def check_music_status(self):
-        for event in pygame.event.get():
-            if event.type == self.SONG_END:
-                print("Song finished.")
-                self.is_playing = False
-                self.is_paused = False
-                if self.current_song:
-                    self.history.append(self.current_song)
-                self.current_song = None
-                self.current_song_changed.emit(None)
-                self.play_next_from_queue()
+        """Shuffles the current queue (and whatever a running shuffle hadn't queued yet)."""
+        # The deque isn't indexable in O(1), so the shuffle reads a list of it
+        songs = list(self.queue)
+        if self.shuffle is not None: songs.extend(self.shuffle.take(self.shuffle.remaining()))
+        self.shuffle = LazyShuffle(songs)
+        self.queue = deque(self.shuffle.take(SHUFFLE_LOOKAHEAD))
+        self.queue_reset.emit(self.queue)
+        self.announce_next()
+
+    def forget_songs(self, songs):
+        """Songs deleted from the library: a running shuffle won't queue them any more."""
+        if self.shuffle is not None: self.shuffle.discard(songs)
+
+    def top_up_queue(self):
+        """Keeps SHUFFLE_LOOKAHEAD songs of a running shuffle queued, and lets the radio refill an empty queue."""
+        if self.shuffle is not None and len(self.queue) < SHUFFLE_LOOKAHEAD:
+            songs = self.shuffle.take(SHUFFLE_LOOKAHEAD - len(self.queue))
+            if not songs: self.shuffle = None # Every song came up once
+            else:
+                self.queue.extend(songs)
+                self.queue_inserted.emit(len(self.queue) - len(songs), songs)
+        if self.radio is not None and self.shuffle is None and not self.queue:
+            self.queue_similar()
+
+    def set_radio(self, index):
+        """Turns the radio on with a similarity.SimilarityIndex, or off with None."""
+        self.radio = index
+        if index is not None and self.current_song is not None:
+            self.top_up_queue()
+            self.announce_next()
+
+    def queue_similar(self):
+        """Queues RADIO_BATCH songs like the ones just played."""
+        seeds = ([self.current_song] if self.current_song else []) + self.history[:-RADIO_SEEDS - 1:-1] # Newest first
+        seeds = seeds[:RADIO_SEEDS]
+        if not seeds: return
+        self.radio.update(seeds) # Their play counts went up since they were indexed
+        songs = self.radio.similar(seeds, RADIO_BATCH, exclude=set(self.history[-RADIO_MEMORY:]))
+        if songs:
+            self.queue.extend(songs)
+            self.queue_inserted.emit(len(self.queue) - len(songs), songs)
+
+    def on_engine_finished(self, song):
+        """The engine noticed the track ran out, so move on to the next one."""
+        if song is not self.current_song: return
+        print("Song finished.")
+        self.song_listened.emit(song, 1.0)
+        self.is_playing = False
+        self.is_paused = False
+        self.resumed_at = None
+        if self.current_song:
+            self.history.append(self.current_song)
+        self.current_song = None
+        self.announced_next = None # The engine forgets it once the track is over
+        self.current_song_changed.emit(None)
+        self.play_next_from_queue()
+
+    def on_engine_advanced(self, song, next_song):
+        """The engine already moved on to the song we announced; catch the queue and state up."""
+        if song is not self.current_song: return # We'd already stopped or skipped it
+        print("Song finished.")
+        self.song_listened.emit(song, 1.0)
+        self.history.append(song)
+        self.announced_next = None
+        if self.queue and self.queue[0] is next_song:
+            self.queue.popleft()
+            self.queue_removed.emit(0, 1)
+        self.current_song = next_song
+        self.top_up_queue() # Once current_song is set, the radio goes by it
+        self.current_pos_offset = 0.0
+        self.resumed_at = None # Until on_engine_started
+        self.current_song_changed.emit(next_song)
+        self.announce_next()
 
     def play_next_from_queue(self):
         if self.is_playing: return
+        if len(self.queue) == 0: self.top_up_queue() # The radio may have more
         if len(self.queue) == 0: return
 
-        song = self.queue.pop(0)
+        song = self.queue.popleft()
+        self.queue_removed.emit(0, 1)
         self.current_song = song
+        self.top_up_queue()
         
-        try:
-            pygame.mixer.music.load(song.filepath)
-            self.current_pos_offset = 0.0
-            pygame.mixer.music.play()
-            song.play()
-            self.is_playing = True
-            self.is_paused = False
-            
-            self.current_song_changed.emit(self.current_song)
-            self.queue_changed.emit(self.queue)
-            self.playback_state_changed.emit(True)
-        except Exception as e:
-            print(f"Error: {e}")
-            self.is_playing = False
+        # Loading happens on the engine thread, a failure comes back through on_engine_failed
+        self.level(song, LEVEL_WAIT)
+        self.engine.submit("play", song, 0.0)
+        self.current_pos_offset = 0.0
+        self.resumed_at = None
+        self.is_playing = True
+        self.is_paused = False
+        
+        self.current_song_changed.emit(self.current_song)
+        self.playback_state_changed.emit(True)
+        self.announce_next()
 
     def toggle_playback(self):
         if not self.current_song: return
         if self.is_paused:
-            pygame.mixer.music.unpause()
+            self.engine.submit("resume")
+            self.resumed_at = time.perf_counter()
             self.is_paused = False
             self.is_playing = True
             self.playback_state_changed.emit(True)
         elif self.is_playing:
-            pygame.mixer.music.pause()
+            self.engine.submit("pause")
+            self.current_pos_offset = self.get_current_position()
+            self.resumed_at = None
             self.is_paused = True
             self.is_playing = False
             self.playback_state_changed.emit(False)
 
     def seek(self, seconds):
         if self.current_song:
-            try:
-                pygame.mixer.music.play(start=seconds)
-                self.current_pos_offset = seconds
-                self.is_playing = True
-                self.is_paused = False
-                self.playback_state_changed.emit(True)
-            except Exception as e:
-                print(f"Seek error: {e}")
+            self.engine.submit("seek", self.current_song, seconds)
+            self.current_pos_offset = seconds
+            self.resumed_at = None # Until the engine reports the restart
+            self.is_playing = True
+            self.is_paused = False
+            self.playback_state_changed.emit(True)
 
     def get_current_position(self):
+        # Tracked with our own clock, so the GUI never has to ask the mixer
         if not self.current_song: return 0
-        pygame_pos_seconds = pygame.mixer.music.get_pos() / 1000.0
-        if pygame_pos_seconds < 0: return self.current_pos_offset
-        return self.current_pos_offset + pygame_pos_seconds
+        if self.resumed_at is None: return self.current_pos_offset
+        return self.current_pos_offset + (time.perf_counter() - self.resumed_at)
 
     def skip_to_next(self):
         self.stop()
@@ -138,15 +295,28 @@ class AudioPlayer(QObject):
     def play_previous_song(self):
         if len(self.history) == 0: return
         self.stop()
-        if self.current_song: self.queue.insert(0, self.current_song)
+        if self.current_song:
+            self.queue.appendleft(self.current_song)
+            self.queue_inserted.emit(0, [self.current_song])
         self.current_song = None
         prev_song = self.history.pop()
-        self.queue.insert(0, prev_song)
+        self.queue.appendleft(prev_song)
+        self.queue_inserted.emit(0, [prev_song])
         self.play_next_from_queue()
 
+    def report_listened(self):
+        """Emits song_listened for the song being left, if it was playing or paused."""
+        song = self.current_song
+        if song and (self.is_playing or self.is_paused):
+            fraction = self.get_current_position() / song.duration if song.duration > 0 else 0.0
+            self.song_listened.emit(song, fraction)
+
     def stop(self):
-        pygame.mixer.music.stop()
+        self.report_listened()
+        self.engine.submit("stop")
+        self.announced_next = None # Stopping clears the engine's next song too
         self.is_playing = False
         self.is_paused = False
         self.current_pos_offset = 0.0
+        self.resumed_at = None
         self.playback_state_changed.emit(False)
\ No newline at end of file
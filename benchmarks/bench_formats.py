@@ -0,0 +1,43 @@
+"""
+Text vs Binary Library Benchmark
+Compares loading songs.txt with opening and loading the mmap'd binary format.
+
+    python benchmarks/bench_formats.py [song count]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from music_library import MusicLibrary
+from player import load_songs_from_file
+from library_binary import BinarySongTable, convert_text_to_binary, load_songs_from_binary
+from synthetic_library import write_synthetic_library
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<36}{(time.perf_counter() - start) * 1000:>10.1f} ms")
+    return result
+
+def main(count):
+    with tempfile.TemporaryDirectory() as folder: # Deleted afterwards, songs.bin and all
+        text_file = write_synthetic_library(os.path.join(folder, "songs.txt"), count)
+        binary_file = os.path.join(folder, "songs.bin")
+        print(f"{count} songs")
+        timed("convert text -> binary", lambda: convert_text_to_binary(text_file, binary_file))
+        print(f"{'size text / binary':<36}{os.path.getsize(text_file) / 1e6:>7.1f} MB / {os.path.getsize(binary_file) / 1e6:.1f} MB")
+
+        timed("text: load into MusicLibrary", lambda: load_songs_from_file(MusicLibrary(), text_file))
+        timed("binary: load into MusicLibrary", lambda: load_songs_from_binary(MusicLibrary(), binary_file))
+        table = timed("binary: open (mmap + header)", lambda: BinarySongTable(binary_file))
+        rows = random.Random(0).sample(range(len(table)), min(1000, len(table)))
+        timed("binary: decode 1000 random rows", lambda: [table[row] for row in rows])
+        timed("binary: decode every row", lambda: sum(1 for _ in table))
+        table.close()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
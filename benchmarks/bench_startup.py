@@ -0,0 +1,52 @@
+"""
+Startup Benchmark
+Starts the real program several times on a generated library and reports time-to-first-frame
+(the empty window is painted) and time-to-interactive (the library is loaded and shown).
+
+    python benchmarks/bench_startup.py [song count] [runs]
+
+Runs offscreen with a dummy audio driver. Results are also written to bench_startup.json.
+"""
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from synthetic_library import write_synthetic_library
+
+STARTUP_LINE = re.compile(r"Startup: first frame (\d+) ms, interactive (\d+) ms")
+
+def run_once(folder):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", SDL_AUDIODRIVER="dummy", MUSICIFY_QUIT_WHEN_READY="1")
+    result = subprocess.run([sys.executable, os.path.join(REPO, "gui_main.py")], cwd=folder, env=env,
+                            capture_output=True, text=True, timeout=300)
+    match = STARTUP_LINE.search(result.stdout)
+    if not match: raise RuntimeError(f"No startup line in the output:\n{result.stdout}\n{result.stderr}")
+    return int(match.group(1)), int(match.group(2))
+
+def main(count, runs):
+    folder = tempfile.mkdtemp()
+    library_file = os.path.join(folder, "songs.txt")
+    first_frames, interactives = [], []
+    for _ in range(runs):
+        # Each run compacts the journal into songs.txt, so start from the same file every time
+        write_synthetic_library(library_file, count, skewed=True)
+        first_frame, interactive = run_once(folder)
+        first_frames.append(first_frame)
+        interactives.append(interactive)
+        print(f"first frame {first_frame:>6} ms   interactive {interactive:>6} ms")
+    report = {"songs": count, "first_frame_ms": first_frames, "interactive_ms": interactives,
+              "first_frame_median_ms": statistics.median(first_frames),
+              "interactive_median_ms": statistics.median(interactives)}
+    print(f"median: first frame {report['first_frame_median_ms']} ms, interactive {report['interactive_median_ms']} ms")
+    with open("bench_startup.json", 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 5)
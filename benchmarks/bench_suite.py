@@ -0,0 +1,218 @@
+"""
+Benchmark Suite
+Times the library, file, queue and view code on generated libraries and writes the results as JSON,
+so two versions can be compared by diffing their result files.
+
+    python benchmarks/bench_suite.py                          # 1k and 100k songs
+    python benchmarks/bench_suite.py --sizes 1000000 --repeat 1 --output bench_1m.json
+    python benchmarks/bench_suite.py --compare bench_before.json  # flags anything 20% slower
+
+The window is created on Qt's offscreen platform and the playback engine is replaced by a stub,
+so no display or sound card is needed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtWidgets import QApplication
+
+import audio_player
+import similarity
+from music_library import MusicLibrary
+from player import load_songs_from_file, save_songs_to_file
+from synthetic_library import write_synthetic_library
+
+QUEUE_OPS = 1000 # Individual queue operations per measurement
+
+class StubEngine(QObject):
+    """Stands in for PlaybackEngine: same signals, but commands go nowhere."""
+    started = Signal(object, float, float)
+    failed = Signal(object, str)
+    finished = Signal(object)
+    advanced = Signal(object, object)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+
+    def start(self): pass
+    def submit(self, command, *args): pass
+    def shutdown(self, timeout=2.0): pass
+    def latency_stats(self): return {}
+    def gap_stats(self): return None
+
+def measure(func, repeat, setup=None):
+    """Runs func repeat times (after setup, which isn't timed) and returns the timings in ms."""
+    runs = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        if setup: func(state)
+        else: func()
+        runs.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(runs), "median_ms": statistics.median(runs), "runs_ms": runs}
+
+def bench_library(count, folder, repeat):
+    results = {}
+    text_file = write_synthetic_library(os.path.join(folder, f"songs_{count}.txt"), count, skewed=True)
+    results["load_songs_from_file"] = measure(lambda: load_songs_from_file(MusicLibrary(), text_file), repeat)
+    library = MusicLibrary()
+    load_songs_from_file(library, text_file)
+    save_file = os.path.join(folder, f"saved_{count}.txt")
+    results["save_songs_to_file"] = measure(lambda: save_songs_to_file(library, save_file), repeat)
+    results["get_sorted_song_list"] = measure(library.get_sorted_song_list, repeat)
+    results["get_sorted_song_list (title, reversed)"] = measure(lambda: library.get_sorted_song_list("title", True), repeat)
+    results["get_songs_by_album"] = measure(library.get_songs_by_album, repeat)
+    return library, results
+
+def bench_queue(library, repeat):
+    results = {}
+    songs = library.get_sorted_song_list()
+    picks = random.Random(0).sample(songs, min(QUEUE_OPS, len(songs)))
+    player = audio_player.AudioPlayer()
+
+    def filled():
+        player.play_list(songs)
+        return player
+
+    def add_each(p):
+        for song in picks: p.add_to_queue(song)
+    results["play_list"] = measure(filled, repeat)
+    results[f"add_to_queue x{len(picks)}"] = measure(add_each, repeat, setup=filled)
+    results["play_shuffled"] = measure(lambda: player.play_shuffled(songs), repeat)
+    results["shuffle_queue"] = measure(lambda p: p.shuffle_queue(), repeat, setup=filled)
+
+    def move_each(p):
+        rng = random.Random(1)
+        size = len(p.queue)
+        for _ in range(QUEUE_OPS): p.move_in_queue(rng.randrange(size), rng.randrange(size))
+    results[f"move_in_queue x{QUEUE_OPS}"] = measure(move_each, repeat, setup=filled)
+
+    def remove_middle(p):
+        for _ in range(min(QUEUE_OPS, len(p.queue))): p.remove_from_queue(len(p.queue) // 2)
+    results[f"remove_from_queue (middle) x{QUEUE_OPS}"] = measure(remove_middle, repeat, setup=filled)
+
+    def skip_each(p):
+        for _ in range(min(QUEUE_OPS, len(p.queue))): p.skip_to_next()
+    results[f"skip_to_next x{QUEUE_OPS}"] = measure(skip_each, repeat, setup=filled)
+    return results
+
+def build_similarity(library):
+    index = similarity.SimilarityIndex(library)
+    index.build()
+    return index
+
+def bench_similarity(library, repeat):
+    if not similarity.numpy_available(): return {}
+    index = build_similarity(library)
+    songs = library.get_sorted_song_list()
+    seeds = random.Random(2).sample(songs, min(3, len(songs)))
+    recent = set(random.Random(3).sample(songs, min(200, len(songs))))
+    results = {
+        "SimilarityIndex (build)": measure(lambda: build_similarity(library).close(), repeat),
+        "similar (3 seeds, top 5)": measure(lambda: index.similar(seeds, 5, exclude=recent), repeat),
+    }
+    index.close()
+    return results
+
+def bench_views(library, app, repeat):
+    import gui_main
+    window = gui_main.MainWindow(library, audio_player.AudioPlayer())
+    window.show()
+    app.processEvents()
+
+    def refresh_library():
+        window.refresh_library_view()
+        app.processEvents() # Include the layout and paint that follow
+    def refresh_albums():
+        window.refresh_album_view()
+        app.processEvents()
+    results = {
+        "refresh_library_view": measure(refresh_library, repeat),
+        "refresh_album_view": measure(refresh_albums, repeat),
+    }
+    library.unsubscribe(window.on_library_changed)
+    window.journal.close()
+    window.thumbnails.shutdown()
+    window.hide()
+    window.deleteLater()
+    app.processEvents()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def compare(old_report, new_report, threshold=1.2):
+    """Prints every timing that got more than threshold times slower (by median)."""
+    slower = 0
+    for count, results in new_report["results"].items():
+        for name, timing in results.items():
+            old = old_report.get("results", {}).get(count, {}).get(name)
+            if not old or old["median_ms"] <= 0: continue
+            ratio = timing["median_ms"] / old["median_ms"]
+            if ratio > threshold:
+                slower += 1
+                print(f"SLOWER {count} songs, {name}: {old['median_ms']:.1f} -> {timing['median_ms']:.1f} ms ({ratio:.2f}x)")
+    if not slower: print(f"Nothing got more than {threshold:.1f}x slower than {old_report.get('revision')}.")
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", default="1000,100000", help="comma separated song counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--no-gui", action="store_true", help="skip the view benchmarks")
+    parser.add_argument("--compare", help="an earlier result file to check for regressions")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    old_report = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            old_report = json.load(file)
+    audio_player.PlaybackEngine = StubEngine # Stub out the mixer for every AudioPlayer made below
+    app = QApplication.instance() or QApplication(sys.argv)
+    folder = tempfile.mkdtemp()
+    os.chdir(folder) # The window opens songs.txt.journal and .thumbnails/ in the working directory
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    for count in [int(size) for size in args.sizes.split(",")]:
+        print(f"{count} songs")
+        library, results = bench_library(count, folder, args.repeat)
+        results.update(bench_queue(library, args.repeat))
+        results.update(bench_similarity(library, args.repeat))
+        if not args.no_gui: results.update(bench_views(library, app, args.repeat))
+        for name, timing in results.items():
+            print(f"  {name:<40}{timing['median_ms']:>10.1f} ms")
+        report["results"][str(count)] = results
+
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+    if old_report is not None and compare(old_report, report):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
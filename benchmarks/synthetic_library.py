@@ -0,0 +1,61 @@
+"""
+Synthetic Library Generator
+Writes songs.txt-format files of any size for the benchmarks.
+synthetic_rows() is perfectly even; skewed_rows() looks more like a real collection,
+where a few artists own most of the albums and album lengths vary.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from player import HEADER
+
+def synthetic_rows(count, seed=0):
+    """Yields add_song()-style rows: about 12 tracks per album and 8 albums per artist."""
+    rng = random.Random(seed)
+    genres = ["Rock", "Pop", "Hardcore", "Jazz", "Hip-Hop", "Electronic", "Folk", "Classical"]
+    for i in range(count):
+        album_id = i // 12
+        artist_id = album_id // 8
+        artist = f"Artist {artist_id}"
+        album = f"Album {album_id}"
+        yield (f"Song {i}", artist, album, i % 12 + 1, rng.randint(90, 420), genres[artist_id % len(genres)],
+               f"C:/Music/{artist}/{album}/{i % 12 + 1:02d} Song {i}.mp3", f"C:/Music/{artist}/{album}/cover.jpg")
+
+def skewed_rows(count, seed=0):
+    """
+    Yields rows with a long-tailed artist distribution: album counts per artist follow a Pareto curve
+    (most artists have one or two, a few have dozens) and albums have 4 to 20 tracks.
+    """
+    rng = random.Random(seed)
+    genres = ["Rock", "Pop", "Hardcore", "Jazz", "Hip-Hop", "Electronic", "Folk", "Classical"]
+    weights = [30, 25, 3, 8, 15, 12, 5, 2]
+    i = 0
+    album_id = 0
+    artist_id = 0
+    while i < count:
+        artist = f"Artist {artist_id}"
+        genre = rng.choices(genres, weights)[0]
+        for _ in range(min(int(rng.paretovariate(1.1)), 80)):
+            album = f"Album {album_id}"
+            for track in range(1, rng.randint(4, 20) + 1):
+                if i >= count: return
+                yield (f"Song {i}", artist, album, track, int(rng.lognormvariate(5.4, 0.35)), genre,
+                       f"C:/Music/{artist}/{album}/{track:02d} Song {i}.mp3", f"C:/Music/{artist}/{album}/cover.jpg")
+                i += 1
+            album_id += 1
+        artist_id += 1
+
+def write_synthetic_library(filename, count, seed=0, skewed=False):
+    rows = skewed_rows(count, seed) if skewed else synthetic_rows(count, seed)
+    with open(filename, 'w', encoding='utf-8', newline='\n') as file:
+        file.write(HEADER + "\n")
+        for row in rows:
+            file.write("|".join(str(field) for field in row) + "\n")
+    return filename
+
+if __name__ == "__main__":
+    # python benchmarks/synthetic_library.py out.txt 100000
+    print(write_synthetic_library(sys.argv[1], int(sys.argv[2])))
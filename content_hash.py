@@ -0,0 +1,164 @@
+"""
+Content Hash Module
+Finds songs that are the same recording, whatever they're called: every file is hashed (streamed in
+chunks, ID3 tags left out so retagging doesn't change it) on a pool of processes, and songs whose
+hashes match are reported as duplicates.
+Hashes are remembered by (path, size, mtime) in content_hashes.json, so only new or changed files are read again.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from PySide6.QtCore import QObject, QThread, Signal
+
+from player import _fsync_dir
+
+CHUNK_SIZE = 1 << 20 # Bytes read at a time
+
+def _audio_range(file, size):
+    """(start, end) of the file without its ID3v2 header and ID3v1 footer."""
+    start, end = 0, size
+    header = file.read(10)
+    if len(header) == 10 and header[:3] == b"ID3":
+        # Tag size is "syncsafe": 7 bits per byte
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        start = 10 + tag_size + (10 if header[5] & 0x10 else 0) # Footer flag
+    if end - start >= 128:
+        file.seek(end - 128)
+        if file.read(3) == b"TAG": end -= 128
+    return min(start, end), end
+
+def hash_audio(path):
+    """Hex blake2b of the audio data in path."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        start, end = _audio_range(file, os.fstat(file.fileno()).st_size)
+        file.seek(start)
+        left = end - start
+        while left > 0:
+            chunk = file.read(min(CHUNK_SIZE, left))
+            if not chunk: break
+            digest.update(chunk)
+            left -= len(chunk)
+    return digest.hexdigest()
+
+def _hash_or_none(path):
+    # Runs in the worker processes; a file that can't be read just has no hash
+    try:
+        return hash_audio(path)
+    except OSError:
+        return None
+
+class HashCache:
+    """path -> [size, mtime_ns, hash], stored as JSON."""
+    def __init__(self, filename="content_hashes.json"):
+        self.filename = filename
+        try:
+            with open(filename, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, path, size, mtime):
+        entry = self.entries.get(path)
+        if entry and entry[0] == size and entry[1] == mtime: return entry[2]
+        return None
+
+    def put(self, path, size, mtime, digest):
+        self.entries[path] = [size, mtime, digest]
+
+    def save(self):
+        tmp_name = self.filename + ".tmp"
+        with open(tmp_name, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_name, self.filename)
+        _fsync_dir(self.filename)
+
+def hash_files(paths, cache, workers=None, progress=None, cancelled=None):
+    """
+    Returns {path: hash} for the paths that exist. Cached hashes are used when size and mtime still match,
+    the rest are hashed on a process pool. progress(done, total) is called now and then.
+    """
+    hashes = {}
+    todo = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest = cache.get(path, stat.st_size, stat.st_mtime_ns)
+        if digest is not None: hashes[path] = digest
+        else: todo.append((path, stat.st_size, stat.st_mtime_ns))
+    if progress: progress(0, len(todo))
+    if not todo: return hashes
+    # Spawned rather than forked: forking a process that runs Qt threads isn't safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        results = pool.map(_hash_or_none, [path for path, _, _ in todo], chunksize=16)
+        for done, ((path, size, mtime), digest) in enumerate(zip(todo, results), 1):
+            if digest is not None:
+                hashes[path] = digest
+                cache.put(path, size, mtime, digest)
+            if progress and done % 100 == 0: progress(done, len(todo))
+            if cancelled and cancelled():
+                pool.shutdown(cancel_futures=True)
+                break
+    return hashes
+
+def duplicate_groups(songs, hashes):
+    """Lists of songs (two or more) whose files have the same hash, biggest groups first."""
+    by_hash = {}
+    for song in songs:
+        digest = hashes.get(song.filepath)
+        if digest is not None: by_hash.setdefault(digest, []).append(song)
+    groups = [group for group in by_hash.values() if len(group) > 1]
+    groups.sort(key=len, reverse=True)
+    return groups
+
+def duplicate_report(groups):
+    """Text lines describing each duplicate group."""
+    if not groups: return ["No duplicate files found."]
+    extra = sum(len(group) - 1 for group in groups)
+    lines = [f"{len(groups)} recordings are in the library more than once ({extra} extra copies).", ""]
+    for group in groups:
+        lines.append(f"{len(group)} copies:")
+        for song in group: lines.append(f"    {song.title} - {song.artist} ({song.album})    {song.filepath}")
+        lines.append("")
+    return lines
+
+class DuplicateScanner(QObject):
+    progress = Signal(int, int)  # files hashed, files to hash
+    finished = Signal(object)    # {path: hash}
+
+    def __init__(self, paths, cache_file="content_hashes.json", workers=None):
+        super().__init__()
+        self.paths = paths
+        self.cache_file = cache_file
+        self.workers = workers
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        cache = HashCache(self.cache_file)
+        try:
+            hashes = hash_files(self.paths, cache, self.workers, self.progress.emit, lambda: self._cancelled)
+        except (OSError, RuntimeError) as e: # RuntimeError covers a broken process pool
+            print(f"Duplicate scan failed: {e}")
+            hashes = {}
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"Could not save hash cache: {e}")
+        self.finished.emit(hashes)
+
+def start_duplicate_scan(paths, cache_file="content_hashes.json"):
+    """Creates a scanner on its own thread. Connect to its signals, then call thread.start()."""
+    thread = QThread()
+    scanner = DuplicateScanner(paths, cache_file)
+    scanner.moveToThread(thread)
+    thread.started.connect(scanner.run)
+    scanner.finished.connect(thread.quit)
+    return thread, scanner
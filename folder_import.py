@@ -0,0 +1,134 @@
+"""
+Folder Import Module
+Walks a folder tree, probes audio files on a thread pool and hands the results to the GUI in batches.
+A (path, size, mtime) cache means importing the same tree again only probes new or changed files.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PySide6.QtCore import QObject, QThread, Signal
+
+from metadata_probe import probe_audio, guess_from_filename
+from player import _fsync_dir
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav')
+COVER_NAMES = ('cover.jpg', 'cover.png', 'folder.jpg', 'folder.png', 'front.jpg', 'front.png')
+
+class ImportCache:
+    """Remembers the size and mtime of every file already imported, stored as JSON."""
+    def __init__(self, filename="import_cache.json"):
+        self.filename = filename
+        self.entries = {}
+        try:
+            with open(filename, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_unchanged(self, path, size, mtime):
+        return self.entries.get(path) == [size, mtime]
+
+    def mark(self, path, size, mtime):
+        self.entries[path] = [size, mtime]
+
+    def save(self):
+        tmp_name = self.filename + ".tmp"
+        with open(tmp_name, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_name, self.filename)
+        _fsync_dir(self.filename)
+
+def scan_folder(root):
+    """Yields (path, size, mtime_ns, cover_path) for every audio file under root."""
+    pending = [root]
+    while pending:
+        folder = pending.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            print(f"Skipped folder {folder}: {e}")
+            continue
+        cover = ""
+        audio = []
+        for entry in entries:
+            name = entry.name.lower()
+            if entry.is_dir(follow_symlinks=False): pending.append(entry.path)
+            elif name.endswith(AUDIO_EXTENSIONS): audio.append(entry)
+            elif name in COVER_NAMES and not cover: cover = entry.path.replace('\\', '/')
+        for entry in audio:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            yield entry.path.replace('\\', '/'), stat.st_size, stat.st_mtime_ns, cover
+
+def probe_to_row(path, cover=""):
+    """Builds add_song() arguments for one file from its tags, falling back to the file and folder names."""
+    meta = probe_audio(path)
+    track, title = guess_from_filename(path)
+    album = meta.album or os.path.basename(os.path.dirname(path))
+    return (meta.title or title, meta.artist or "Unknown Artist", album, meta.track_number or track,
+            int(round(meta.duration)), meta.genre, path, cover)
+
+class FolderImporter(QObject):
+    batch_ready = Signal(list)   # add_song() rows
+    progress = Signal(int, int)  # files probed, files to probe
+    finished = Signal(str)
+
+    def __init__(self, root, cache_file="import_cache.json", workers=8, batch_size=500):
+        super().__init__()
+        self.root = root
+        self.cache_file = cache_file
+        self.workers = workers
+        self.batch_size = batch_size
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        cache = ImportCache(self.cache_file)
+        files = [f for f in scan_folder(self.root) if not cache.is_unchanged(f[0], f[1], f[2])]
+        done = 0
+        failed = 0
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(probe_to_row, path, cover): (path, size, mtime) for path, size, mtime, cover in files}
+            for future in as_completed(futures):
+                if self._cancelled:
+                    for f in futures: f.cancel()
+                    break
+                path, size, mtime = futures[future]
+                done += 1
+                try:
+                    batch.append(future.result())
+                    cache.mark(path, size, mtime)
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    print(f"Could not import {path}: {e}")
+                if len(batch) >= self.batch_size:
+                    self.batch_ready.emit(batch)
+                    batch = []
+                    self.progress.emit(done, len(files))
+        if self._cancelled:
+            # Batches still in flight may never reach the library, so don't remember any of them
+            self.finished.emit("Import cancelled.")
+            return
+        if batch: self.batch_ready.emit(batch)
+        self.progress.emit(done, len(files))
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"Could not save import cache: {e}")
+        message = f"Imported {done - failed} files"
+        if failed: message += f" ({failed} failed)"
+        self.finished.emit(message + ".")
+
+def start_folder_import(root, cache_file="import_cache.json"):
+    """Creates an importer on its own thread. Connect to its signals, then call thread.start()."""
+    thread = QThread()
+    importer = FolderImporter(root, cache_file)
+    importer.moveToThread(thread)
+    thread.started.connect(importer.run)
+    importer.finished.connect(thread.quit)
+    return thread, importer
@@ -3,21 +3,39 @@ GUI Main Program (Album Play/Shuffle Edition)
 """
 import sys
 import os
-import pygame 
-import random
+import time
+from bisect import bisect_left
+from collections import deque
+STARTED_AT = time.perf_counter() # Before the Qt imports, for the startup timings
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-    QListWidget, QPushButton, QLabel, QFrame, QTableWidget, QTableWidgetItem, 
+    QListWidget, QListView, QPushButton, QLabel, QFrame, QTableView, 
     QHeaderView, QSlider, QAbstractItemView, QStackedWidget, QLineEdit, 
     QDialog, QFormLayout, QFileDialog, QScrollArea, QGridLayout,
-    QListWidgetItem
+    QListWidgetItem, QPlainTextEdit, QStyledItemDelegate, QStyleOptionViewItem
 )
-from PySide6.QtCore import Qt, QTimer, QSize
-from PySide6.QtGui import QColor, QBrush, QIcon, QPixmap
+from PySide6.QtCore import Qt, QTimer, QSize, QEvent, Signal
+from PySide6.QtGui import QIcon, QKeySequence, QShortcut, QPainter, QColor
 
-from music_library import MusicLibrary, _format_duration
-from player import (load_songs_from_file, save_songs_to_file)
+from music_library import MusicLibrary, _format_duration, sort_songs, SORT_KEYS, make_song_id
+from player import (add_song_rows, apply_journal_records, LibraryJournal)
 from audio_player import AudioPlayer
+import pcm_cache
+from play_stats import PlayStats
+from library_loader import start_library_loader
+from view_models import SongTableModel, QueueListModel, SORT_BY_COLUMN, DEFAULT_SORT_COLUMN, MAX_DELTA_ROWS
+from metadata_probe import probe_audio, guess_from_filename
+from folder_import import start_folder_import
+from content_hash import start_duplicate_scan, duplicate_groups, duplicate_report
+from audio_analysis import AudioAnalyzer
+import similarity
+from thumbnail_cache import ThumbnailCache, ALBUM_SIZE, NOW_PLAYING_SIZE
+import instrumentation
+from instrumentation import timed
+
+SEARCH_LIMIT = 5000 # Rows shown for a search; typing more narrows it down anyway
+LOAD_BUDGET = 0.010 # Seconds of loaded rows added per pass of the event loop, so the window keeps repainting
+LOAD_SLICE = 100    # Rows added between looks at the clock
 
 # --- Dialog (Unchanged) ---
 class AddSongDialog(QDialog):
@@ -72,17 +90,24 @@ class AddSongDialog(QDialog):
         if f: 
             self.file_path_edit.setText(f)
             try:
-                if not self.title_edit.text():
-                    filename = os.path.splitext(os.path.basename(f))[0]
-                    parts = filename.split(' ', 1)
-                    if len(parts) > 1 and parts[0].isdigit():
-                        self.track_edit.setText(parts[0])
-                        self.title_edit.setText(parts[1])
-                    else:
-                        self.title_edit.setText(filename)
-                sound = pygame.mixer.Sound(f)
-                self.duration_edit.setText(str(int(sound.get_length())))
-            except: pass
+                # Only reads the file headers, never decodes the audio
+                meta = probe_audio(f)
+            except (OSError, ValueError) as e:
+                print(f"Could not read {f}: {e}")
+                return
+            if not self.title_edit.text():
+                if meta.title:
+                    self.title_edit.setText(meta.title)
+                else:
+                    track, title = guess_from_filename(f)
+                    if track: self.track_edit.setText(str(track))
+                    self.title_edit.setText(title)
+            for edit, value in ((self.artist_edit, meta.artist), (self.album_edit, meta.album), (self.genre_edit, meta.genre)):
+                if value and not edit.text(): edit.setText(value)
+            if meta.track_number and not self.track_edit.text():
+                self.track_edit.setText(str(meta.track_number))
+            if meta.duration:
+                self.duration_edit.setText(str(int(round(meta.duration))))
 
     def browse_img(self):
         f, _ = QFileDialog.getOpenFileName(self, "Select Art", "", "Images (*.png *.jpg)")
@@ -91,13 +116,148 @@ class AddSongDialog(QDialog):
     def get_data(self):
         return (self.title_edit.text(), self.artist_edit.text(), self.album_edit.text(), self.track_edit.text(), self.duration_edit.text(), self.genre_edit.text(), self.file_path_edit.text(), self.img_path_edit.text())
 
+class ProfileDialog(QDialog):
+    """Debug panel with the --profile timings (Ctrl+Shift+P)."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Profile")
+        self.resize(900, 400)
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setStyleSheet("font-family: Consolas, monospace; font-size: 12px;")
+        layout.addWidget(self.text)
+        row = QHBoxLayout()
+        btn_refresh = QPushButton("Refresh")
+        btn_refresh.clicked.connect(self.refresh)
+        btn_export = QPushButton("Export")
+        btn_export.clicked.connect(self.export)
+        row.addWidget(btn_refresh)
+        row.addWidget(btn_export)
+        layout.addLayout(row)
+        self.refresh()
+
+    def refresh(self):
+        self.text.setPlainText("\n".join(instrumentation.summary_lines()) or "Nothing recorded yet.")
+
+    def export(self):
+        try:
+            self.text.appendPlainText(f"\nWritten to {instrumentation.export()}")
+        except OSError as e:
+            self.text.appendPlainText(f"\nCould not write profile: {e}")
+
+class ReportDialog(QDialog):
+    """Read-only text window, for the listening stats and the duplicates report."""
+    def __init__(self, title, lines, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.resize(700, 500)
+        layout = QVBoxLayout(self)
+        text = QPlainTextEdit()
+        text.setReadOnly(True)
+        text.setPlainText("\n".join(lines))
+        layout.addWidget(text)
+
+def stats_report(stats, library):
+    """Most played songs, artists and genres, and what played last."""
+    def name(song_id):
+        song = library.all_songs.get(song_id)
+        return f"{song.title} - {song.artist}" if song else song_id
+    lines = ["Most played songs:"]
+    lines += [f"  {count:>5}  {name(song_id)}" for song_id, count in stats.top_songs(20)]
+    lines += ["", "Most played artists:"]
+    lines += [f"  {count:>5}  {artist}" for artist, count in stats.top_artists(10)]
+    lines += ["", "Most played genres:"]
+    lines += [f"  {count:>5}  {genre}" for genre, count in stats.top_genres(10)]
+    lines += ["", "Recently played:"]
+    lines += [f"  {time.strftime('%Y-%m-%d %H:%M', time.localtime(when))}  {name(song_id)} ({fraction:.0%})"
+              for when, song_id, fraction in stats.recently_played(20)]
+    return lines
+
+ART_ROLE = Qt.ItemDataRole.UserRole + 1 # Album grid items keep their cover's path here, not a QIcon
+
+class AlbumArtDelegate(QStyledItemDelegate):
+    """
+    Draws album covers straight from the thumbnail cache while painting, so only albums on screen get
+    decoded and the cache's byte limit really bounds the memory the grid holds.
+    """
+    def __init__(self, thumbnails, parent=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        self.painting = False
+
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        # Layout asks every item for its size; only painting fetches (and queues) the real cover
+        pixmap = self.thumbnails.get(index.data(ART_ROLE), ALBUM_SIZE) if self.painting else None
+        option.icon = QIcon(pixmap if pixmap is not None else self.thumbnails.placeholder(ALBUM_SIZE))
+        option.features |= QStyleOptionViewItem.ViewItemFeature.HasDecoration
+        option.decorationSize = QSize(ALBUM_SIZE, ALBUM_SIZE)
+
+    def paint(self, painter, option, index):
+        self.painting = True
+        try:
+            super().paint(painter, option, index)
+        finally:
+            self.painting = False
+
+class WaveformSlider(QSlider):
+    """Seek slider with the song's waveform drawn behind the groove."""
+    PLAYED = QColor(136, 204, 241, 110)
+    UNPLAYED = QColor(120, 144, 168, 90)
+
+    def __init__(self, parent=None):
+        super().__init__(Qt.Horizontal, parent)
+        self.setMinimumHeight(30)
+        self.waveform = None
+
+    def set_waveform(self, waveform):
+        self.waveform = waveform or None
+        self.update()
+
+    def paintEvent(self, event):
+        if self.waveform:
+            painter = QPainter(self)
+            width, height = self.width(), self.height()
+            loudest = max(self.waveform) or 1
+            played_x = width * (self.value() - self.minimum()) / max(self.maximum() - self.minimum(), 1)
+            step = width / len(self.waveform)
+            for i, level in enumerate(self.waveform):
+                bar = max(1.0, (height - 4) * level / loudest)
+                x = i * step
+                painter.fillRect(int(x), int((height - bar) / 2), max(int(step) - 1, 1), int(bar),
+                                 self.PLAYED if x < played_x else self.UNPLAYED)
+            painter.end()
+        super().paintEvent(event)
+
 class MainWindow(QMainWindow):
+    first_frame_painted = Signal()
+
     def __init__(self, library, player):
         super().__init__()
         self.library = library
         self.player = player
         self.is_dragging_slider = False 
         self.current_view_songs = [] # Track songs currently in the table for Play/Shuffle buttons
+        self.view_subset = None      # Songs of the album/search on screen, None for the whole library
+        self.view_album = None       # Album name while an album is on screen
+        self.sort_by = SORT_BY_COLUMN[DEFAULT_SORT_COLUMN]
+        self.sort_reverse = False
+        self.loader_thread = None
+        self.loader = None
+        self.load_queue = deque() # ("rows", rows) / ("journal", records) / ("finished", message) from the loader
+        self.load_offset = 0      # Rows of the first queued batch already added
+        self.import_thread = None
+        self.importer = None
+        self.scan_thread = None
+        self.scanner = None
+        self.similarity = None # Built (on a thread) the first time the radio is switched on, then kept up to date
+        self.journal = LibraryJournal("songs.txt") # Changes are appended here instead of rewriting songs.txt
+        self.thumbnails = ThumbnailCache(parent=self)
+        self.play_stats = PlayStats() # Read when loading starts, saved on close
+        self.album_items = {}        # album name -> its item in the album grid
+        self.first_frame_ms = None  # Startup timings, from STARTED_AT
+        self.interactive_ms = None
         
         self.setWindowTitle("Musicify")
         self.resize(1200, 800)
@@ -105,13 +265,29 @@ class MainWindow(QMainWindow):
         self.setup_ui()
         self.apply_gentle_blue_theme()
         self.connect_signals()
+        self.library.subscribe(self.on_library_changed)
         
-        self.show_all_songs_view()
-        self.refresh_album_view()
+        # Nothing is filled in before the first paint; the views are normally empty until the loader runs anyway
+        self.lbl_page_title.setText("All Songs")
+        self.center_stack.setCurrentIndex(0)
+        if self.library.all_songs: QTimer.singleShot(0, self.refresh_views_after_load)
+        self.installEventFilter(self) # Just to catch the first paint
         
+        # Only runs while something is playing, and wakes up once per displayed second
         self.playback_timer = QTimer(self)
+        self.playback_timer.setSingleShot(True)
         self.playback_timer.timeout.connect(self.update_ui_timer) 
-        self.playback_timer.start(100) 
+        self.shown_second = -1
+
+        # Adds queued loader batches a time slice at a time, between repaints
+        self.load_timer = QTimer(self)
+        self.load_timer.setInterval(0)
+        self.load_timer.timeout.connect(self.apply_load_queue)
+
+        # Only with --profile / MUSICIFY_PROFILE=1
+        self.stall_watcher = instrumentation.start_stall_watcher(self)
+        if instrumentation.ENABLED:
+            QShortcut(QKeySequence("Ctrl+Shift+P"), self, activated=lambda: ProfileDialog(self).show())
 
     def setup_ui(self):
         self.main_container = QWidget()
@@ -144,9 +320,13 @@ class MainWindow(QMainWindow):
         self.btn_library = QPushButton("All Songs")
         self.btn_albums = QPushButton("Albums")
         self.btn_add_song = QPushButton("+ Add New Song")
+        self.btn_import_folder = QPushButton("+ Import Folder")
+        self.btn_stats = QPushButton("Listening Stats")
+        self.btn_duplicates = QPushButton("Find Duplicates")
+        self.lbl_status = QLabel(""); self.lbl_status.setObjectName("StatusLabel"); self.lbl_status.setWordWrap(True)
         
-        layout.addWidget(self.btn_library); layout.addWidget(self.btn_albums)
-        layout.addStretch(); layout.addWidget(self.btn_add_song)
+        layout.addWidget(self.btn_library); layout.addWidget(self.btn_albums); layout.addWidget(self.btn_stats); layout.addWidget(self.btn_duplicates)
+        layout.addStretch(); layout.addWidget(self.lbl_status); layout.addWidget(self.btn_add_song); layout.addWidget(self.btn_import_folder)
 
     def setup_center_content(self):
         self.center_stack = QStackedWidget()
@@ -187,15 +367,24 @@ class MainWindow(QMainWindow):
         hc_layout.addWidget(self.btn_play_album)
         hc_layout.addWidget(self.btn_shuffle_album)
         hc_layout.addStretch()
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search songs, artists, albums...")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.setFixedWidth(280)
+        hc_layout.addWidget(self.search_edit)
         
         header_layout.addWidget(self.header_controls)
 
         # Table
-        self.song_table = QTableWidget()
-        self.song_table.setColumnCount(5) 
-        self.song_table.setHorizontalHeaderLabels(["#", "Title", "Artist", "Album", "🕒"])
+        self.song_model = SongTableModel(self)
+        self.song_table = QTableView()
+        self.song_table.setModel(self.song_model)
         self.song_table.setShowGrid(False)
         self.song_table.verticalHeader().setVisible(False)
+        # Fixed row height so Qt never has to measure rows that aren't visible
+        self.song_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.song_table.verticalHeader().setDefaultSectionSize(32)
         self.song_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.song_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.song_table.setFocusPolicy(Qt.NoFocus)
@@ -203,7 +392,13 @@ class MainWindow(QMainWindow):
         self.song_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.song_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
         self.song_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeToContents)
+        # Size those two from the rows on screen only; otherwise every row change re-measures a thousand rows
+        self.song_table.horizontalHeader().setResizeContentsPrecision(0)
         self.song_table.horizontalHeader().setSectionResizeMode(4, QHeaderView.Fixed); self.song_table.setColumnWidth(4, 60)
+        # Header clicks sort; we do it ourselves from the library's cached orders rather than through Qt
+        self.song_table.horizontalHeader().setSectionsClickable(True)
+        self.song_table.horizontalHeader().setSortIndicatorShown(True)
+        self.song_table.horizontalHeader().setSortIndicator(DEFAULT_SORT_COLUMN, Qt.AscendingOrder)
 
         lib_layout.addWidget(self.header_frame)
         lib_layout.addWidget(self.song_table)
@@ -216,9 +411,10 @@ class MainWindow(QMainWindow):
         alb_layout.addWidget(lbl_alb_header)
         self.album_list_widget = QListWidget()
         self.album_list_widget.setViewMode(QListWidget.IconMode)
-        self.album_list_widget.setIconSize(QSize(140, 140))
+        self.album_list_widget.setIconSize(QSize(ALBUM_SIZE, ALBUM_SIZE))
         self.album_list_widget.setResizeMode(QListWidget.Adjust)
         self.album_list_widget.setSpacing(20)
+        self.album_list_widget.setItemDelegate(AlbumArtDelegate(self.thumbnails, self.album_list_widget))
         alb_layout.addWidget(self.album_list_widget)
         
         self.center_stack.addWidget(self.page_library)
@@ -230,7 +426,10 @@ class MainWindow(QMainWindow):
         layout = QVBoxLayout(self.right_sidebar)
         layout.setContentsMargins(15, 20, 15, 20)
         lbl_queue = QLabel("Up Next"); lbl_queue.setObjectName("HeaderLabel")
-        self.queue_list = QListWidget()
+        self.queue_model = QueueListModel(self.player, self)
+        self.queue_list = QListView()
+        self.queue_list.setModel(self.queue_model)
+        self.queue_list.setUniformItemSizes(True)
         self.btn_clear_queue = QPushButton("Clear Queue")
         layout.addWidget(lbl_queue); layout.addWidget(self.queue_list); layout.addWidget(self.btn_clear_queue)
 
@@ -254,7 +453,7 @@ class MainWindow(QMainWindow):
         btns_l.addWidget(self.btn_prev); btns_l.addWidget(self.btn_play); btns_l.addWidget(self.btn_skip)
         slider_row = QWidget(); sl_l = QHBoxLayout(slider_row)
         self.lbl_curr_time = QLabel("0:00"); self.lbl_curr_time.setObjectName("TimeLabel")
-        self.seek_slider = QSlider(Qt.Horizontal); self.seek_slider.setCursor(Qt.PointingHandCursor)
+        self.seek_slider = WaveformSlider(); self.seek_slider.setCursor(Qt.PointingHandCursor)
         self.lbl_total_time = QLabel("0:00"); self.lbl_total_time.setObjectName("TimeLabel")
         sl_l.addWidget(self.lbl_curr_time); sl_l.addWidget(self.seek_slider); sl_l.addWidget(self.lbl_total_time)
         ctrl_l.addWidget(btns_row); ctrl_l.addWidget(slider_row)
@@ -262,7 +461,9 @@ class MainWindow(QMainWindow):
         # Actions
         act_w = QWidget(); act_l = QHBoxLayout(act_w); act_l.setAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
         self.btn_add_queue = QPushButton("+ Queue"); self.btn_add_queue.setFixedWidth(80)
-        act_l.addWidget(self.btn_add_queue)
+        self.btn_radio = QPushButton("📻 Radio"); self.btn_radio.setObjectName("RadioButton"); self.btn_radio.setCheckable(True)
+        self.btn_radio.setToolTip("Keep playing similar songs when the queue runs out")
+        act_l.addWidget(self.btn_radio); act_l.addWidget(self.btn_add_queue)
 
         layout.addWidget(info_w, 30); layout.addWidget(ctrl_w, 40); layout.addWidget(act_w, 30)
 
@@ -279,9 +480,10 @@ class MainWindow(QMainWindow):
             #NowPlayingTitle { font-size: 14px; font-weight: bold; color: #FFFFFF; }
             #NowPlayingArtist { font-size: 12px; color: #88CCF1; }
             #TimeLabel { font-size: 11px; color: #6B7D8C; min-width: 30px; }
+            #StatusLabel { font-size: 11px; color: #6B7D8C; }
             QPushButton { background-color: transparent; color: #B0C0D0; border: none; font-size: 14px; font-weight: 600; padding: 10px; text-align: left; border-radius: 5px; }
             QPushButton:hover { background-color: rgba(255, 255, 255, 0.05); color: #FFFFFF; }
-            QPushButton[text="+ Add New Song"] { color: #88CCF1; }
+            QPushButton[text="+ Add New Song"], QPushButton[text="+ Import Folder"] { color: #88CCF1; }
             #PlayButton { background-color: #FFFFFF; color: #0F171E; border-radius: 19px; font-size: 16px; padding: 0px; text-align: center; }
             #PlayButton:hover { background-color: #E0E0E0; }
             QPushButton[text="⏮"], QPushButton[text="⏭"] { color: #FFFFFF; font-size: 18px; text-align: center; padding: 0px; }
@@ -289,9 +491,10 @@ class MainWindow(QMainWindow):
             #AlbumPlayButton:hover { background-color: #1ed760; transform: scale(1.05); }
             #AlbumShuffleButton { color: #B0C0D0; font-size: 20px; }
             #AlbumShuffleButton:hover { color: white; }
-            QTableWidget, QListWidget { background-color: transparent; border: none; color: #B0C0D0; font-size: 13px; outline: none; }
-            QTableWidget::item { padding: 5px; }
-            QTableWidget::item:selected, QListWidget::item:selected { background-color: rgba(136, 204, 241, 0.15); color: #88CCF1; }
+            #RadioButton:checked { color: #88CCF1; background-color: rgba(136, 204, 241, 0.15); }
+            QTableView, QListWidget, QListView { background-color: transparent; border: none; color: #B0C0D0; font-size: 13px; outline: none; }
+            QTableView::item { padding: 5px; }
+            QTableView::item:selected, QListWidget::item:selected, QListView::item:selected { background-color: rgba(136, 204, 241, 0.15); color: #88CCF1; }
             QHeaderView::section { background-color: transparent; color: #6B7D8C; border: none; border-bottom: 1px solid #22303C; padding: 5px; font-weight: bold; }
             QSlider::groove:horizontal { border: none; height: 4px; background: #2C3E50; border-radius: 2px; }
             QSlider::sub-page:horizontal { background: #88CCF1; border-radius: 2px; }
@@ -302,26 +505,47 @@ class MainWindow(QMainWindow):
         self.btn_library.clicked.connect(self.show_all_songs_view)
         self.btn_albums.clicked.connect(lambda: self.center_stack.setCurrentIndex(1))
         self.btn_add_song.clicked.connect(self.open_add_song_dialog)
+        self.btn_import_folder.clicked.connect(self.open_import_folder_dialog)
+        self.btn_duplicates.clicked.connect(self.start_duplicate_scan)
+        self.btn_stats.clicked.connect(lambda: ReportDialog("Listening Stats", stats_report(self.play_stats, self.library), self).show())
 
         self.btn_play.clicked.connect(self.toggle_play_logic)
         self.btn_skip.clicked.connect(self.player.skip_to_next)
         self.btn_prev.clicked.connect(self.player.play_previous_song)
         self.btn_clear_queue.clicked.connect(self.player.stop)
         self.btn_add_queue.clicked.connect(self.add_table_selection_to_queue)
+        self.btn_radio.toggled.connect(self.toggle_radio)
+
+        # Search runs once typing pauses for a moment, not on every key
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+
+        # Checks whether the radio's index is ready yet
+        self.radio_timer = QTimer(self)
+        self.radio_timer.setSingleShot(True)
+        self.radio_timer.setInterval(200)
+        self.radio_timer.timeout.connect(self.start_radio)
         
         # Header Buttons
         self.btn_play_album.clicked.connect(self.play_current_view)
         self.btn_shuffle_album.clicked.connect(self.shuffle_current_view)
 
-        self.song_table.cellDoubleClicked.connect(self.on_table_double_click)
+        self.song_table.horizontalHeader().sortIndicatorChanged.connect(self.on_sort_changed)
+        self.song_table.doubleClicked.connect(lambda index: self.on_table_double_click(index.row(), index.column()))
         self.album_list_widget.itemDoubleClicked.connect(self.on_album_double_click)
 
         self.seek_slider.sliderPressed.connect(self.on_slider_pressed)
         self.seek_slider.sliderReleased.connect(self.on_slider_released)
 
         self.player.current_song_changed.connect(self.update_now_playing_ui)
-        self.player.queue_changed.connect(self.update_queue_ui)
         self.player.playback_state_changed.connect(self.update_play_button_icon)
+        self.player.playback_state_changed.connect(self.schedule_ui_tick)
+        self.player.song_listened.connect(self.play_stats.record)
+        if self.player.analyzer is not None: self.player.analyzer.analyzed.connect(self.on_song_analyzed)
+        self.thumbnails.thumbnail_ready.connect(self.on_thumbnail_ready)
 
     # --- Logic ---
 
@@ -332,80 +556,332 @@ class MainWindow(QMainWindow):
             try:
                 dur = int(data[4])
                 track = int(data[3]) if data[3] else 0
-                self.library.add_song(data[0], data[1], data[2], track, dur, data[5], data[6], data[7])
-                if self.lbl_page_title.text() == "All Songs":
-                    self.refresh_library_view()
-                self.refresh_album_view()
-                save_songs_to_file(self.library)
+                row = (data[0], data[1], data[2], track, dur, data[5], data[6], data[7])
+                if add_song_rows(self.library, [row]):
+                    print(f"⚠️ '{data[6] or data[0]}' is already in the library!")
+                    return
+                # The views pick the new song up from the library's change notification
+                self.journal.append_add(self.library.all_songs[make_song_id(row[0], row[6])])
+                self.maybe_compact_journal()
             except ValueError: print("Invalid Number")
 
+    def on_library_changed(self, change):
+        """Shows a library change by patching the rows and albums involved instead of rebuilding the views."""
+        if change.removed: self.player.forget_songs(change.removed)
+        # An edited song may point at a cover that was replaced on disk under the same name
+        if change.updated: self.thumbnails.invalidate(song.image_path for song in change.updated if song.image_path)
+        if self.is_loading():
+            # Only appended while loading, the table is sorted once it's done
+            if self.lbl_page_title.text() == "All Songs" and self.view_subset is None:
+                self.song_model.append_songs(change.added)
+            self.apply_album_changes(change.albums, limit=None)
+            return
+        if self.is_importing(): return # Refreshes the views itself when done
+        self.lbl_status.setText(f"{len(self.library.all_songs)} songs")
+        title = self.lbl_page_title.text()
+        if title.startswith("Search:"):
+            self.search_timer.start() # Search results aren't kept sorted by the library, run it again
+        elif title == "All Songs" or self.view_album is not None:
+            if self.view_album is None: belongs = None
+            else: belongs = lambda song: song.album == self.view_album
+            if not self.song_model.apply_change(change, SORT_KEYS[self.sort_by], self.sort_reverse, belongs):
+                self.refresh_library_view(self.view_subset)
+        self.apply_album_changes(change.albums)
+
+    def maybe_compact_journal(self, force=False):
+        # Compacting a half-loaded library would drop the rest of songs.txt
+        if self.is_loading(): return
+        if force or self.journal.needs_compaction():
+            print(self.journal.compact(self.library))
+
+    # --- Background Loading ---
+
+    def start_loading(self, filename="songs.txt"):
+        """Loads the library on a worker thread, filling the views as batches arrive."""
+        self.journal.close()
+        self.journal = LibraryJournal(filename)
+        if not self.play_stats.loaded: self.play_stats.load()
+        self.loader_thread, self.loader = start_library_loader(filename)
+        self.loader.batch_loaded.connect(self.on_songs_loaded)
+        self.loader.journal_loaded.connect(self.on_journal_loaded)
+        self.loader.rows_rejected.connect(self.on_rows_rejected)
+        self.loader.progress.connect(self.on_load_progress)
+        self.loader.finished.connect(self.on_load_finished)
+        self.lbl_status.setText("Loading library...")
+        self.loader_thread.start()
+
+    def is_loading(self):
+        # Until the last queued batch is in, not just until the loader thread is done
+        return self.loader_thread is not None and (self.loader_thread.isRunning() or bool(self.load_queue))
+
+    # The loader's output is queued and added by apply_load_queue, never all at once in the slot
+
+    def on_songs_loaded(self, rows):
+        self.load_queue.append(("rows", rows))
+        self.load_timer.start()
+
+    def on_journal_loaded(self, records):
+        self.load_queue.append(("journal", records))
+        self.load_timer.start()
+
+    @timed("window.apply_load_queue")
+    def apply_load_queue(self):
+        deadline = time.perf_counter() + LOAD_BUDGET
+        while self.load_queue and time.perf_counter() < deadline:
+            kind, payload = self.load_queue[0]
+            if kind == "rows":
+                rows = payload[self.load_offset:self.load_offset + LOAD_SLICE]
+                self.load_offset += len(rows)
+                for row in add_song_rows(self.library, rows):
+                    print(f"Skipped duplicate song: {row[0]}")
+                if self.load_offset < len(payload): continue
+                self.load_offset = 0
+                self.load_queue.popleft()
+                self.loader.batch_applied()
+            elif kind == "journal":
+                self.load_queue.popleft()
+                apply_journal_records(self.library, payload)
+            else:
+                self.load_queue.popleft()
+                self.finish_loading(payload)
+        if not self.load_queue: self.load_timer.stop()
+
+    def on_rows_rejected(self, bad_rows):
+        for line_number, line, reason in bad_rows:
+            print(f"Skipped line {line_number} ({reason}): {line}")
+
+    def on_load_progress(self, bytes_read, total):
+        percent = int(bytes_read * 100 / total) if total else 100
+        self.lbl_status.setText(f"Loading library... {percent}% ({len(self.library.all_songs)} songs)")
+
+    def on_load_finished(self, message):
+        self.load_queue.append(("finished", message))
+        self.load_timer.start()
+
+    def finish_loading(self, message):
+        print(message)
+        self.lbl_status.setText(f"{len(self.library.all_songs)} songs")
+        self.loader_thread.wait()
+        # The album grid is already complete, the table was only appended to
+        if self.lbl_page_title.text() == "All Songs": self.refresh_library_view(self.view_subset)
+        self.play_stats.restore_play_counts(self.library)
+        self.maybe_compact_journal()
+        # Index for the search box in the background; a search before it's done says so and tries again
+        self.library.search_index.build_in_background(list(self.library.all_songs.values()))
+        if self.interactive_ms is None:
+            self.interactive_ms = (time.perf_counter() - STARTED_AT) * 1000
+            instrumentation.record("startup.interactive", self.interactive_ms)
+            print(f"Startup: first frame {self.first_frame_ms or 0:.0f} ms, interactive {self.interactive_ms:.0f} ms")
+            if os.environ.get("MUSICIFY_QUIT_WHEN_READY"): QTimer.singleShot(0, self.close) # For benchmarks/bench_startup.py
+
+    # --- Folder Import ---
+
+    def open_import_folder_dialog(self):
+        if self.is_importing(): return
+        folder = QFileDialog.getExistingDirectory(self, "Import Folder")
+        if folder: self.start_folder_import(folder)
+
+    def start_folder_import(self, folder):
+        self.import_thread, self.importer = start_folder_import(folder)
+        self.importer.batch_ready.connect(self.on_import_batch)
+        self.importer.progress.connect(self.on_import_progress)
+        self.importer.finished.connect(self.on_import_finished)
+        self.btn_import_folder.setEnabled(False)
+        self.lbl_status.setText("Scanning folder...")
+        self.import_thread.start()
+
+    def is_importing(self):
+        return self.import_thread is not None and self.import_thread.isRunning()
+
+    def on_import_batch(self, rows):
+        # Re-importing a folder is how a replaced cover.jpg gets picked up, even for songs already in the library
+        self.thumbnails.invalidate(row[7] for row in rows if row[7])
+        duplicates = add_song_rows(self.library, rows)
+        skipped = set(map(id, duplicates))
+        added = [self.library.all_songs[make_song_id(row[0], row[6])] for row in rows if id(row) not in skipped]
+        # One fsync per batch, the views are only refreshed once the import is done
+        self.journal.append_adds(added)
+
+    # --- Duplicate Scan ---
+
+    def start_duplicate_scan(self):
+        if self.scan_thread is not None and self.scan_thread.isRunning(): return
+        paths = list({song.filepath for song in self.library.all_songs.values() if song.filepath})
+        self.scan_thread, self.scanner = start_duplicate_scan(paths)
+        self.scanner.progress.connect(self.on_duplicate_scan_progress)
+        self.scanner.finished.connect(self.on_duplicate_scan_finished)
+        self.btn_duplicates.setEnabled(False)
+        self.lbl_status.setText("Checking for duplicates...")
+        self.scan_thread.start()
+
+    def on_duplicate_scan_progress(self, done, total):
+        self.lbl_status.setText(f"Checking for duplicates... {done}/{total} files")
+
+    def on_duplicate_scan_finished(self, hashes):
+        self.btn_duplicates.setEnabled(True)
+        self.lbl_status.setText(f"{len(self.library.all_songs)} songs")
+        groups = duplicate_groups(self.library.all_songs.values(), hashes)
+        ReportDialog("Duplicates", duplicate_report(groups), self).show()
+
+    def on_import_progress(self, done, total):
+        self.lbl_status.setText(f"Importing... {done}/{total} files")
+
+    def on_import_finished(self, message):
+        print(message)
+        self.btn_import_folder.setEnabled(True)
+        self.lbl_status.setText(f"{len(self.library.all_songs)} songs")
+        self.refresh_views_after_load()
+        self.maybe_compact_journal()
+
+    @timed("window.refresh_views_after_load")
+    def refresh_views_after_load(self):
+        if self.lbl_page_title.text() == "All Songs":
+            self.refresh_library_view()
+        self.refresh_album_view()
+
     def update_ui_timer(self):
-        self.player.check_music_status()
         if self.player.is_playing and self.player.current_song and not self.is_dragging_slider:
             pos = self.player.get_current_position() 
-            total = self.player.current_song.duration
-            if total > 0:
-                self.seek_slider.setRange(0, total)
-                self.seek_slider.setValue(int(pos))
-                self.lbl_curr_time.setText(_format_duration(pos))
-                self.lbl_total_time.setText(_format_duration(total))
+            second = int(pos)
+            # Widgets are only touched when the displayed second actually changes
+            if second != self.shown_second and self.player.current_song.duration > 0:
+                self.shown_second = second
+                self.seek_slider.setValue(second)
+                self.lbl_curr_time.setText(_format_duration(second))
+        self.schedule_ui_tick()
+
+    def schedule_ui_tick(self, *_):
+        if not (self.player.is_playing and self.player.current_song):
+            self.playback_timer.stop() # Paused or idle: no wakeups at all
+            return
+        pos = self.player.get_current_position()
+        # Wake up just after the next whole second
+        self.playback_timer.start(int((1.0 - pos % 1.0) * 1000) + 10)
 
     def on_slider_pressed(self): self.is_dragging_slider = True
     def on_slider_released(self):
+        self.shown_second = -1
         self.player.seek(self.seek_slider.value())
         self.is_dragging_slider = False
 
     def toggle_play_logic(self):
         if self.player.current_song: self.player.toggle_playback()
-        elif self.song_table.rowCount() > 0: self.on_table_double_click(0, 0)
+        elif self.song_model.rowCount() > 0: self.on_table_double_click(0, 0)
 
     def update_play_button_icon(self, is_playing):
         self.btn_play.setText("||" if is_playing else "▶")
         # Also update the big header button
         self.btn_play_album.setText("||" if is_playing else "▶")
 
+    def eventFilter(self, obj, event):
+        if obj is self and event.type() == QEvent.Type.Paint and self.first_frame_ms is None:
+            self.first_frame_ms = (time.perf_counter() - STARTED_AT) * 1000
+            instrumentation.record("startup.first_frame", self.first_frame_ms)
+            self.removeEventFilter(self)
+            QTimer.singleShot(0, self.first_frame_painted.emit) # After this paint has finished
+        return super().eventFilter(obj, event)
+
+    @timed("window.run_search")
+    def run_search(self):
+        text = self.search_edit.text().strip()
+        if not text:
+            self.show_all_songs_view()
+            return
+        songs = self.library.search(text, limit=SEARCH_LIMIT, wait=False)
+        if songs is None:
+            # Still indexing (a big library takes a few seconds after loading), try again shortly
+            self.lbl_page_title.setText(f'Search: "{text}" (indexing...)')
+            self.search_timer.start()
+            return
+        title = f'Search: "{text}"'
+        if len(songs) == SEARCH_LIMIT: title += f" (first {SEARCH_LIMIT})"
+        self.lbl_page_title.setText(title)
+        self.view_album = None
+        self.refresh_library_view(songs)
+        self.center_stack.setCurrentIndex(0)
+
     def show_all_songs_view(self):
+        if self.search_edit.text():
+            self.search_edit.blockSignals(True) # Clearing it shouldn't trigger another search
+            self.search_edit.clear()
+            self.search_edit.blockSignals(False)
         self.lbl_page_title.setText("All Songs")
+        self.view_album = None
         self.refresh_library_view(None)
         self.center_stack.setCurrentIndex(0)
 
+    def on_sort_changed(self, column, order):
+        self.sort_by = SORT_BY_COLUMN[column]
+        self.sort_reverse = order == Qt.SortOrder.DescendingOrder
+        self.refresh_library_view(self.view_subset)
+
+    @timed("window.refresh_library_view")
     def refresh_library_view(self, songs_to_display=None):
-        self.song_table.setRowCount(0)
+        self.view_subset = songs_to_display
         if songs_to_display is None:
-            songs = self.library.get_sorted_song_list()
+            songs = self.library.get_sorted_song_list(self.sort_by, self.sort_reverse)
         else:
-            songs = songs_to_display
+            songs = sort_songs(songs_to_display, self.sort_by, self.sort_reverse)
             
         # Store current view for play/shuffle buttons
         self.current_view_songs = songs 
-            
-        self.song_table.setRowCount(len(songs))
-        for row, song in enumerate(songs):
-            track_item = QTableWidgetItem(str(song.track_number))
-            track_item.setData(Qt.ItemDataRole.UserRole, song)
-            track_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            title_item = QTableWidgetItem(song.title)
-            title_item.setForeground(QBrush(QColor("#E3F2FD")))
-            self.song_table.setItem(row, 0, track_item)
-            self.song_table.setItem(row, 1, title_item)
-            self.song_table.setItem(row, 2, QTableWidgetItem(song.artist))
-            self.song_table.setItem(row, 3, QTableWidgetItem(song.album))
-            self.song_table.setItem(row, 4, QTableWidgetItem(_format_duration(song.duration)))
+        # The model only hands out cell text for the rows on screen
+        self.song_model.set_songs(songs)
 
+    @timed("window.refresh_album_view")
     def refresh_album_view(self):
         self.album_list_widget.clear()
-        albums = self.library.get_songs_by_album()
-        for album_name, songs in albums.items():
-            art_path = songs[0].image_path if songs else ""
-            item = QListWidgetItem(album_name)
-            if os.path.exists(art_path): item.setIcon(QIcon(art_path))
-            item.setData(Qt.ItemDataRole.UserRole, songs)
-            self.album_list_widget.addItem(item)
+        self.album_items = {}
+        # Straight from the index (only read here), get_songs_by_album() would copy every album
+        for album_name in self.library.album_names:
+            self.album_list_widget.addItem(self.make_album_item(album_name, self.library.album_index[album_name]))
+
+    def make_album_item(self, album_name, songs):
+        item = QListWidgetItem(album_name)
+        # The delegate draws the cover (or the placeholder until it's decoded) when the item is on screen
+        item.setData(ART_ROLE, songs[0].image_path if songs else "")
+        item.setData(Qt.ItemDataRole.UserRole, album_name)
+        self.album_items[album_name] = item
+        return item
+
+    @timed("window.apply_album_changes")
+    def apply_album_changes(self, album_names, limit=MAX_DELTA_ROWS):
+        """Adds, removes or re-arts just the grid items of these albums (rebuilds the grid past limit of them)."""
+        if not album_names: return
+        if limit is not None and len(album_names) > limit:
+            self.refresh_album_view()
+            return
+        # Gone albums first, so the grid matches library.album_names for the positions below
+        for name in album_names:
+            item = self.album_items.get(name)
+            if item is not None and name not in self.library.album_index:
+                del self.album_items[name]
+                self.album_list_widget.takeItem(self.album_list_widget.row(item))
+        for name in sorted(album_names):
+            songs = self.library.album_index.get(name)
+            if not songs: continue
+            item = self.album_items.get(name)
+            if item is None:
+                row = bisect_left(self.library.album_names, name)
+                self.album_list_widget.insertItem(row, self.make_album_item(name, songs))
+            else:
+                # The first track (and so the cover) may be a different song now
+                item.setData(ART_ROLE, songs[0].image_path)
+
+    def on_thumbnail_ready(self, path, size):
+        pixmap = self.thumbnails.get(path, size)
+        if pixmap is None: return
+        if size == ALBUM_SIZE:
+            self.album_list_widget.viewport().update() # Covers on screen are drawn again, now from the cache
+        elif size == NOW_PLAYING_SIZE:
+            song = self.player.current_song
+            if song and song.image_path == path: self.lbl_art.setPixmap(pixmap)
 
     def on_album_double_click(self, item):
-        songs = item.data(Qt.ItemDataRole.UserRole)
+        songs = self.library.get_album(item.data(Qt.ItemDataRole.UserRole))
         if songs:
             self.lbl_page_title.setText(item.text())
+            self.view_album = item.data(Qt.ItemDataRole.UserRole)
             self.refresh_library_view(songs)
             self.center_stack.setCurrentIndex(0)
 
@@ -418,57 +894,122 @@ class MainWindow(QMainWindow):
     def shuffle_current_view(self):
         """Plays the songs currently visible, but shuffled."""
         if self.current_view_songs:
-            # Copy list so we don't mess up the table order
-            shuffled = list(self.current_view_songs)
-            import random
-            random.shuffle(shuffled)
-            self.player.play_list(shuffled)
+            # Songs are picked by position as they're needed, and the view's list is patched in place when the
+            # library changes, so the shuffle gets a snapshot (a tuple of references, not a shuffle); Shift+click favours the most played
+            weighted = bool(QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier)
+            self.player.play_shuffled(tuple(self.current_view_songs), weighted=weighted)
+
+    def toggle_radio(self, on):
+        if on and self.similarity is None:
+            if not similarity.numpy_available():
+                print("Radio needs NumPy")
+                self.btn_radio.setChecked(False); self.btn_radio.setEnabled(False); self.btn_radio.setToolTip("Radio needs NumPy")
+                return
+            # A second or two on a huge library, once, on a thread; after that it follows the library's changes
+            self.similarity = similarity.SimilarityIndex(self.library)
+            self.similarity.build_in_background()
+        if on: self.start_radio()
+        else:
+            self.radio_timer.stop()
+            self.btn_radio.setText("📻 Radio")
+            self.player.set_radio(None)
+
+    def start_radio(self):
+        """Hands the player the radio's index once it's built; until then the button says it's still indexing."""
+        if not self.btn_radio.isChecked(): return
+        if self.similarity.is_building():
+            self.btn_radio.setText("📻 Indexing...")
+            self.radio_timer.start()
+            return
+        self.btn_radio.setText("📻 Radio")
+        self.player.set_radio(self.similarity)
 
     def get_song_from_table_row(self, row):
-        return self.song_table.item(row, 0).data(Qt.ItemDataRole.UserRole)
+        return self.song_model.song_at(row)
 
     def on_table_double_click(self, row, col):
         song = self.get_song_from_table_row(row)
         if song: self.player.play_now(song)
 
     def add_table_selection_to_queue(self):
-        row = self.song_table.currentRow()
+        row = self.song_table.currentIndex().row()
         if row >= 0:
             song = self.get_song_from_table_row(row)
             if song: self.player.add_to_queue(song)
 
+    @timed("window.update_now_playing_ui")
     def update_now_playing_ui(self, song):
         if song:
             self.lbl_now_title.setText(song.title)
             self.lbl_now_artist.setText(song.artist)
             self.lbl_total_time.setText(_format_duration(song.duration))
+            self.seek_slider.setRange(0, max(song.duration, 0))
+            self.seek_slider.setValue(0)
+            self.lbl_curr_time.setText("0:00")
+            self.shown_second = 0
             self.btn_play.setText("||") 
-            if os.path.exists(song.image_path): self.lbl_art.setPixmap(QPixmap(song.image_path))
-            else: self.lbl_art.clear()
+            analysis = self.player.analyzer.cached(song.filepath) if self.player.analyzer else None
+            self.seek_slider.set_waveform(analysis.waveform if analysis else None)
+            pixmap = self.thumbnails.get(song.image_path, NOW_PLAYING_SIZE)
+            self.lbl_art.setPixmap(pixmap if pixmap is not None else self.thumbnails.placeholder(NOW_PLAYING_SIZE))
         else:
             self.lbl_now_title.setText("Select a song")
             self.lbl_now_artist.setText("")
             self.lbl_curr_time.setText("0:00")
             self.lbl_total_time.setText("0:00")
             self.seek_slider.setValue(0)
+            self.seek_slider.set_waveform(None)
             self.btn_play.setText("▶")
             self.lbl_art.clear()
 
-    def update_queue_ui(self, queue):
-        self.queue_list.clear()
-        for song in queue:
-            self.queue_list.addItem(f"{song.title} • {song.artist}")
+    def on_song_analyzed(self, path, analysis):
+        song = self.player.current_song
+        if song is not None and song.filepath == path: self.seek_slider.set_waveform(analysis.waveform)
 
     def closeEvent(self, event):
-        print(save_songs_to_file(self.library))
+        self.library.unsubscribe(self.on_library_changed)
+        self.radio_timer.stop()
+        if self.similarity is not None: self.similarity.close()
+        if self.scan_thread is not None and self.scan_thread.isRunning():
+            self.scanner.finished.disconnect(self.on_duplicate_scan_finished) # No report while closing
+            self.scanner.cancel()
+            self.scan_thread.quit()
+            self.scan_thread.wait()
+        if self.is_importing():
+            # Batches already added are in the journal, the rest is picked up by the next import
+            self.importer.cancel()
+            self.import_thread.quit()
+            self.import_thread.wait()
+        if self.is_loading():
+            # Saving a half-loaded library would drop the rest of songs.txt
+            self.load_timer.stop()
+            self.loader.cancel()
+            self.loader_thread.quit()
+            self.loader_thread.wait()
+            print("Closed while loading, journal left for next start.")
+        else:
+            # Only rewrites songs.txt if something changed since the last compaction
+            self.maybe_compact_journal(force=True)
+        self.journal.close()
+        self.thumbnails.shutdown()
+        self.player.shutdown()
+        self.play_stats.close() # After the player, which reports the song playing at exit
         event.accept()
 
 def main():
     app = QApplication(sys.argv)
     library = MusicLibrary()
-    load_songs_from_file(library)
-    player = AudioPlayer()
+    # The decoded-audio cache is opt-in (--pcm-cache): it trades disk space and decoding for instant seeking
+    player = AudioPlayer(pcm_cache=pcm_cache.PcmCache() if pcm_cache.ENABLED else None, analyzer=AudioAnalyzer())
     window = MainWindow(library, player)
+
+    def start_background_work():
+        # Library, mixer and album art only start once the empty window is on screen
+        if window.loader is not None: return
+        window.start_loading()
+        player.start_engine()
+    window.first_frame_painted.connect(start_background_work)
+    QTimer.singleShot(500, start_background_work) # In case the window starts hidden and never paints
     window.show()
     sys.exit(app.exec())
 
@@ -0,0 +1,133 @@
+"""
+Instrumentation Module
+Opt-in timing for the slow paths: run with --profile or MUSICIFY_PROFILE=1.
+Spans are collected into histograms, the Qt event loop is watched for stalls,
+and everything is written to profile.json (or MUSICIFY_PROFILE_FILE) on exit.
+When profiling is off, @timed returns the function untouched and span() is a shared no-op.
+"""
+import atexit
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.environ.get("MUSICIFY_PROFILE", "") not in ("", "0") or "--profile" in sys.argv
+PROFILE_FILE = os.environ.get("MUSICIFY_PROFILE_FILE", "profile.json")
+STALL_MS = 100 # Event loop hiccups longer than this are logged
+
+_NO_SPAN = nullcontext()
+
+class Histogram:
+    """Counts timings in power-of-two millisecond buckets: <0.125, <0.25, ... <8192, and everything above."""
+    BUCKETS = 17
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms: self.max_ms = ms
+        index = 0 if ms < 0.125 else min(int(math.log2(ms / 0.125)) + 1, self.BUCKETS - 1)
+        self.buckets[index] += 1
+
+    def percentile(self, fraction):
+        """Upper edge of the bucket holding that fraction of the samples."""
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= wanted and count: return min(0.125 * 2 ** index, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        return {"count": self.count, "total_ms": round(self.total_ms, 3), "max_ms": round(self.max_ms, 3),
+                "p50_ms": round(self.percentile(0.5), 3), "p99_ms": round(self.percentile(0.99), 3), "buckets": self.buckets}
+
+_histograms = {}
+_lock = threading.Lock() # Spans come from the GUI, loader, engine and decode threads
+
+def record(name, ms):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None: histogram = _histograms[name] = Histogram()
+        histogram.add(ms)
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000)
+
+def span(name):
+    """with span("thing"): ... times the block when profiling is on."""
+    return _span(name) if ENABLED else _NO_SPAN
+
+def timed(name):
+    """Decorator that records every call of the function under name."""
+    def decorate(func):
+        if not ENABLED: return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorate
+
+def snapshot():
+    with _lock:
+        return {name: histogram.to_dict() for name, histogram in sorted(_histograms.items())}
+
+def summary_lines():
+    """One line per span, slowest total first, for the debug panel and the console."""
+    rows = sorted(snapshot().items(), key=lambda item: -item[1]["total_ms"])
+    return [f"{name:<36}{h['count']:>8} calls {h['total_ms']:>10.1f} ms total  p50 <{h['p50_ms']:.1f}  p99 <{h['p99_ms']:.1f}  max {h['max_ms']:.1f} ms"
+            for name, h in rows]
+
+def export(filename=None):
+    filename = filename or PROFILE_FILE
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "spans": snapshot()}, file, indent=2)
+    return filename
+
+def _export_at_exit():
+    if not _histograms: return
+    try:
+        print(f"Profile written to {export()}")
+    except OSError as e:
+        print(f"Could not write profile: {e}")
+
+if ENABLED: atexit.register(_export_at_exit)
+
+def start_stall_watcher(parent, interval_ms=50, threshold_ms=STALL_MS):
+    """
+    Fires a timer every interval_ms on the GUI thread. How late it fires is how long the event loop was busy,
+    recorded as "event_loop.lag"; anything over threshold_ms is also printed. Returns the timer, or None when off.
+    """
+    if not ENABLED: return None
+    from PySide6.QtCore import QTimer, Qt
+    timer = QTimer(parent)
+    timer.setTimerType(Qt.TimerType.PreciseTimer)
+    last = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        lag = (now - last[0]) * 1000 - interval_ms
+        last[0] = now
+        record("event_loop.lag", max(lag, 0.0))
+        if lag > threshold_ms: print(f"UI stall: event loop blocked for {lag:.0f} ms")
+    timer.timeout.connect(tick)
+    timer.start(interval_ms)
+    return timer
@@ -0,0 +1,155 @@
+"""
+Binary Library Module
+A versioned binary alternative to songs.txt that is read through mmap, so opening it doesn't parse anything.
+
+File layout (all little-endian):
+    header   magic "MSFY", version, flags, row count, string count, heap size
+    rows     one fixed-width record per song: track, duration and six string ids
+             (title, artist, album, genre, filepath, image_path)
+    offsets  string count + 1 offsets into the heap
+    heap     UTF-8 text of every distinct string, stored once, each followed by a NUL byte
+Because strings live in the heap, titles can contain '|' and repeated artists/albums cost nothing extra.
+"""
+import mmap
+import os
+import struct
+import sys
+
+from music_library import MusicLibrary
+from player import load_songs_from_file, add_song_rows, _fsync_dir
+
+MAGIC = b"MSFY"
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIQ')
+ROW = struct.Struct('<ii6I')
+OFFSET = struct.Struct('<Q')
+
+def write_binary_rows(rows, filename="songs.bin"):
+    """Writes add_song()-style rows to filename atomically. Returns the number of rows written."""
+    string_ids = {}
+    strings = []
+    packed_rows = []
+    def string_id(text):
+        sid = string_ids.get(text)
+        if sid is None:
+            sid = string_ids[text] = len(strings)
+            strings.append(text.encode('utf-8'))
+        return sid
+    for title, artist, album, track, duration, genre, filepath, image_path in rows:
+        packed_rows.append(ROW.pack(track, duration, string_id(title), string_id(artist), string_id(album),
+                                    string_id(genre), string_id(filepath), string_id(image_path)))
+    offsets = [0]
+    for data in strings: offsets.append(offsets[-1] + len(data) + 1)
+
+    tmp_name = filename + ".tmp"
+    with open(tmp_name, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, len(packed_rows), len(strings), offsets[-1]))
+        file.write(b"".join(packed_rows))
+        file.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+        file.write(b"".join(data + b"\0" for data in strings))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_name, filename)
+    _fsync_dir(filename)
+    return len(packed_rows)
+
+def save_songs_to_binary(library, filename="songs.bin"):
+    try:
+        rows = ((s.title, s.artist, s.album, s.track_number, s.duration, s.genre, s.filepath, s.image_path)
+                for s in library.all_songs.values())
+        count = write_binary_rows(rows, filename)
+        return f"Saved {count} songs."
+    except Exception as e:
+        return f"Error: {e}"
+
+class BinarySongTable:
+    """
+    Read-only view of a songs.bin file. Opening only maps the file and reads the header;
+    rows are decoded one at a time when asked for.
+    """
+    def __init__(self, filename="songs.bin"):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file
+            self._file.close()
+            raise ValueError(f"{filename} is not a Musicify library file")
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{filename} is not a Musicify library file")
+        magic, version, _, self.row_count, self.string_count, self.heap_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a Musicify library file")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported library file version {version}")
+        self._offsets_start = HEADER.size + self.row_count * ROW.size
+        self._heap_start = self._offsets_start + (self.string_count + 1) * OFFSET.size
+        if self._heap_start + self.heap_size > len(self._map):
+            self.close()
+            raise ValueError(f"{filename} is truncated")
+        self._strings = {} # Decoded strings, shared between rows
+
+    def __len__(self):
+        return self.row_count
+
+    def __getitem__(self, row):
+        if row < 0: row += self.row_count
+        if not 0 <= row < self.row_count: raise IndexError(row)
+        track, duration, *ids = ROW.unpack_from(self._map, HEADER.size + row * ROW.size)
+        title, artist, album, genre, filepath, image_path = (self._string(sid) for sid in ids)
+        return (title, artist, album, track, duration, genre, filepath, image_path)
+
+    def __iter__(self):
+        # Reading everything anyway, so decode every string up front and walk the rows in one pass.
+        # Strings are cut at the offset table, not at NULs, which the text itself may contain
+        offsets = struct.unpack_from(f'<{self.string_count + 1}Q', self._map, self._offsets_start)
+        heap = self._map[self._heap_start:self._heap_start + self.heap_size]
+        strings = [str(heap[start:end - 1], 'utf-8') for start, end in zip(offsets, offsets[1:])]
+        del heap
+        rows = self._map[HEADER.size:self._offsets_start]
+        for track, duration, title, artist, album, genre, filepath, image_path in ROW.iter_unpack(rows):
+            yield (strings[title], strings[artist], strings[album], track, duration, strings[genre], strings[filepath], strings[image_path])
+
+    def _string(self, sid):
+        text = self._strings.get(sid)
+        if text is None:
+            start, end = struct.unpack_from('<2Q', self._map, self._offsets_start + sid * OFFSET.size)
+            text = self._strings[sid] = str(self._map[self._heap_start + start:self._heap_start + end - 1], 'utf-8')
+        return text
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_songs_from_binary(library, filename="songs.bin"):
+    if not os.path.exists(filename):
+        return "No save file found."
+    try:
+        with BinarySongTable(filename) as table:
+            duplicates = add_song_rows(library, table)
+            count = len(table) - len(duplicates)
+    except ValueError as e:
+        return f"Error: {e}"
+    if duplicates: return f"Loaded {count} songs ({len(duplicates)} rejected)."
+    return f"Loaded {count} songs."
+
+def convert_text_to_binary(text_filename="songs.txt", binary_filename="songs.bin"):
+    """Converts songs.txt (plus its journal) to the binary format."""
+    library = MusicLibrary()
+    print(load_songs_from_file(library, text_filename))
+    return save_songs_to_binary(library, binary_filename)
+
+if __name__ == "__main__":
+    # python library_binary.py [songs.txt] [songs.bin]
+    print(convert_text_to_binary(*sys.argv[1:3]))
@@ -0,0 +1,75 @@
+"""
+Library Loader Module
+Parses songs.txt on a worker thread so the window can open before the library is loaded.
+"""
+import os
+import threading
+from PySide6.QtCore import QObject, QThread, Signal
+
+from player import iter_song_batches, iter_journal_records, journal_path
+
+MAX_QUEUED_BATCHES = 4 # Parsed ahead of the GUI thread; more would only pile up in memory
+
+class LibraryLoader(QObject):
+    """
+    Streams songs.txt in batches on a QThread.
+    Parsed rows are handed back to the GUI thread, which owns the MusicLibrary. It calls batch_applied()
+    for every batch it has added, and the loader waits while MAX_QUEUED_BATCHES are still waiting for that.
+    """
+    batch_loaded = Signal(list)      # parsed add_song() rows
+    rows_rejected = Signal(list)     # (line_number, line, reason)
+    journal_loaded = Signal(list)    # records from songs.txt.journal, applied after the base rows
+    progress = Signal(int, int)      # bytes read, total bytes
+    finished = Signal(str)           # status message
+
+    def __init__(self, filename="songs.txt", batch_size=2000):
+        super().__init__()
+        self.filename = filename
+        self.batch_size = batch_size
+        self._cancelled = False
+        self._room = threading.Semaphore(MAX_QUEUED_BATCHES)
+
+    def cancel(self):
+        self._cancelled = True
+        self._room.release() # In case run() is waiting for the GUI thread
+
+    def batch_applied(self):
+        """Called from the GUI thread when a batch_loaded batch is in the library."""
+        self._room.release()
+
+    def run(self):
+        has_base = os.path.exists(self.filename)
+        if not has_base and not os.path.exists(journal_path(self.filename)):
+            self.finished.emit("No save file found.")
+            return
+        total = os.path.getsize(self.filename) if has_base else 0
+        parsed = 0
+        rejected = 0
+        try:
+            batches = iter_song_batches(self.filename, self.batch_size) if has_base else []
+            for rows, bad_rows, bytes_read in batches:
+                if rows: self._room.acquire()
+                if self._cancelled:
+                    self.finished.emit("Loading cancelled.")
+                    return
+                if rows: self.batch_loaded.emit(rows)
+                if bad_rows: self.rows_rejected.emit(bad_rows)
+                parsed += len(rows)
+                rejected += len(bad_rows)
+                self.progress.emit(bytes_read, total)
+            records = list(iter_journal_records(self.filename))
+            if records: self.journal_loaded.emit(records)
+        except OSError as e:
+            self.finished.emit(f"Error: {e}")
+            return
+        if rejected: self.finished.emit(f"Read {parsed} songs ({rejected} rejected).")
+        else: self.finished.emit(f"Read {parsed} songs.")
+
+def start_library_loader(filename="songs.txt", batch_size=2000):
+    """Creates a loader on its own thread. Connect to its signals, then call thread.start()."""
+    thread = QThread()
+    loader = LibraryLoader(filename, batch_size)
+    loader.moveToThread(thread)
+    thread.started.connect(loader.run)
+    loader.finished.connect(thread.quit)
+    return thread, loader
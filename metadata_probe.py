@@ -0,0 +1,225 @@
+"""
+Metadata Probe Module
+Reads duration and tags from audio file headers without decoding any audio.
+WAV: RIFF fmt/data chunks and LIST/INFO tags. MP3: ID3v2/ID3v1 tags and the Xing/Info, VBRI or first frame header.
+"""
+import os
+import struct
+
+MAX_SYNC_SEARCH = 64 * 1024 # How far past the ID3 tag we look for the first MP3 frame
+MAX_TEXT_FRAME = 4096       # Longer text frames are skipped, pictures are never read
+
+class AudioMetadata:
+    def __init__(self, path):
+        self.path = path
+        self.title = ""
+        self.artist = ""
+        self.album = ""
+        self.genre = ""
+        self.track_number = 0
+        self.duration = 0.0 # Seconds
+
+    def fill_missing(self, other):
+        """Copies fields this probe didn't find from another (e.g. ID3v1 behind ID3v2)."""
+        for name in ("title", "artist", "album", "genre", "track_number"):
+            if not getattr(self, name): setattr(self, name, getattr(other, name))
+
+def probe_audio(path):
+    """
+    Returns AudioMetadata for path. Unknown formats come back with only the defaults filled in.
+    Raises OSError if the file can't be read and ValueError if its headers are broken.
+    """
+    meta = AudioMetadata(path)
+    with open(path, 'rb') as file:
+        start = file.read(12)
+        try:
+            if start[:4] == b"RIFF" and start[8:12] == b"WAVE":
+                _probe_wav(file, meta)
+            else:
+                file.seek(0)
+                _probe_mp3(file, meta, os.fstat(file.fileno()).st_size)
+        except struct.error as e:
+            raise ValueError(f"malformed header: {e}")
+    return meta
+
+def guess_from_filename(path):
+    """Returns (track_number, title) from names like '03 Song Title.mp3'. Track is 0 if there's no number."""
+    filename = os.path.splitext(os.path.basename(path))[0]
+    parts = filename.split(' ', 1)
+    if len(parts) > 1 and parts[0].isdigit():
+        return int(parts[0]), parts[1]
+    return 0, filename
+
+def _parse_track(text):
+    # "3" or "3/12"
+    try:
+        return int(text.split('/')[0].strip())
+    except ValueError:
+        return 0
+
+# --- WAV ---
+
+WAV_INFO_TAGS = {b"INAM": "title", b"IART": "artist", b"IPRD": "album", b"IGNR": "genre"}
+
+def _probe_wav(file, meta):
+    byte_rate = 0
+    data_size = 0
+    while True:
+        header = file.read(8)
+        if len(header) < 8: break
+        chunk_id, size = struct.unpack('<4sI', header)
+        next_chunk = file.tell() + size + (size & 1) # Chunks are padded to even sizes
+        if chunk_id == b"fmt ":
+            fmt = file.read(min(size, 16))
+            if len(fmt) >= 12: byte_rate = struct.unpack_from('<I', fmt, 8)[0]
+        elif chunk_id == b"data":
+            data_size = size
+        elif chunk_id == b"LIST" and size <= MAX_TEXT_FRAME * 4:
+            _read_wav_info(file.read(size), meta)
+        file.seek(next_chunk)
+    if byte_rate: meta.duration = data_size / byte_rate
+
+def _read_wav_info(data, meta):
+    if data[:4] != b"INFO": return
+    pos = 4
+    while pos + 8 <= len(data):
+        tag, size = struct.unpack_from('<4sI', data, pos)
+        value = data[pos + 8:pos + 8 + size].split(b"\0", 1)[0].decode('utf-8', 'replace').strip()
+        if tag in WAV_INFO_TAGS: setattr(meta, WAV_INFO_TAGS[tag], value)
+        elif tag == b"ITRK": meta.track_number = _parse_track(value)
+        pos += 8 + size + (size & 1)
+
+# --- MP3 ---
+
+ID3_FRAMES = {
+    "TIT2": "title", "TPE1": "artist", "TALB": "album", "TCON": "genre", "TRCK": "track", "TLEN": "length",
+    "TT2": "title", "TP1": "artist", "TAL": "album", "TCO": "genre", "TRK": "track", "TLE": "length",
+}
+
+BITRATES = { # kbps by (MPEG 1?, layer)
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def _decode_text(data):
+    encoding = data[:1]
+    body = data[1:]
+    if encoding == b"\x01": text = body.decode('utf-16', 'replace')
+    elif encoding == b"\x02": text = body.decode('utf-16-be', 'replace')
+    elif encoding == b"\x03": text = body.decode('utf-8', 'replace')
+    else: text = body.decode('latin-1')
+    return text.split("\0", 1)[0].strip()
+
+def _read_id3v2(file, meta):
+    """Reads the text frames we care about. Returns the offset where audio starts."""
+    header = file.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    version, flags = header[3], header[5]
+    tag_end = 10 + _syncsafe(header[6:10]) + (10 if flags & 0x10 else 0)
+    pos = 10
+    if flags & 0x40 and version >= 3: # Extended header
+        ext = file.read(4)
+        pos += (_syncsafe(ext) if version == 4 else struct.unpack('>I', ext)[0] + 4)
+    length_ms = 0
+    frame_header_size = 6 if version == 2 else 10
+    while pos + frame_header_size <= tag_end:
+        file.seek(pos)
+        frame = file.read(frame_header_size)
+        if version == 2:
+            frame_id = frame[:3]
+            size = int.from_bytes(frame[3:6], 'big')
+        else:
+            frame_id = frame[:4]
+            size = _syncsafe(frame[4:8]) if version == 4 else struct.unpack('>I', frame[4:8])[0]
+        if not frame_id.strip(b"\0"): break # Padding
+        pos += frame_header_size + size
+        field = ID3_FRAMES.get(frame_id.decode('latin-1'))
+        if field is None or size > MAX_TEXT_FRAME: continue
+        text = _decode_text(file.read(size))
+        if field == "track": meta.track_number = _parse_track(text)
+        elif field == "length": length_ms = int(text) if text.isdigit() else 0
+        else: setattr(meta, field, text)
+    if length_ms: meta.duration = length_ms / 1000.0
+    return tag_end
+
+def _read_id3v1(file, size, meta):
+    """Returns True if the file ends with a 128-byte ID3v1 tag."""
+    if size < 128: return False
+    file.seek(size - 128)
+    tag = file.read(128)
+    if tag[:3] != b"TAG": return False
+    v1 = AudioMetadata(meta.path)
+    v1.title = tag[3:33].split(b"\0", 1)[0].decode('latin-1').strip()
+    v1.artist = tag[33:63].split(b"\0", 1)[0].decode('latin-1').strip()
+    v1.album = tag[63:93].split(b"\0", 1)[0].decode('latin-1').strip()
+    if tag[125] == 0 and tag[126]: v1.track_number = tag[126]
+    meta.fill_missing(v1)
+    return True
+
+def _parse_frame_header(data, pos):
+    """Returns (frame length, samples per frame, sample rate, bitrate kbps, MPEG 1?, mono?) or None."""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0: return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3: return None
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    mono = (b3 >> 6) == 3
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = (samples // 8) * bitrate * 1000 // sample_rate + padding
+    return length, samples, sample_rate, bitrate, mpeg1, mono
+
+def _probe_mp3(file, meta, size):
+    audio_start = _read_id3v2(file, meta)
+    has_v1 = _read_id3v1(file, size, meta)
+    if meta.duration: return # TLEN already told us
+
+    file.seek(audio_start)
+    data = file.read(MAX_SYNC_SEARCH)
+    pos = data.find(b"\xFF")
+    header = None
+    while pos != -1:
+        header = _parse_frame_header(data, pos)
+        # Confirm with the following frame so a stray 0xFF in junk data doesn't fool us
+        if header and (pos + header[0] + 4 > len(data) or _parse_frame_header(data, pos + header[0])): break
+        header = None
+        pos = data.find(b"\xFF", pos + 1)
+    if header is None: return
+    length, samples, sample_rate, bitrate, mpeg1, mono = header
+
+    # VBR files carry a frame count in a Xing/Info or VBRI header inside the first frame
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12:
+        flags = struct.unpack_from('>I', data, xing + 4)[0]
+        if flags & 1:
+            frames = struct.unpack_from('>I', data, xing + 8)[0]
+            meta.duration = frames * samples / sample_rate
+            return
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI" and len(data) >= vbri + 18:
+        frames = struct.unpack_from('>I', data, vbri + 14)[0]
+        meta.duration = frames * samples / sample_rate
+        return
+
+    # Constant bitrate: the audio size tells us the length
+    audio_bytes = size - (audio_start + pos) - (128 if has_v1 else 0)
+    meta.duration = audio_bytes * 8 / (bitrate * 1000)
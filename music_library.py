@@ -3,7 +3,12 @@ Music Library Module (Final Version)
 Contains classes for Song and MusicLibrary with Track Numbers & Art support.
 """
 import math
-from collections import defaultdict
+import sys
+from bisect import insort, bisect_left
+from contextlib import contextmanager
+
+from instrumentation import timed
+from search_index import SearchIndex
 
 def _format_duration(total_seconds):
     try:
@@ -15,7 +20,17 @@ def _format_duration(total_seconds):
     except (ValueError, TypeError):
         return "0:00"
 
+def make_song_id(title, filepath):
+    """A song is its file, so the same file can't be added twice under different titles. Songs without a file go by title."""
+    # Why the path and not content_hash.hash_audio(): the ID is needed the moment a song is added, including every row
+    # of songs.txt at startup, and hashing means reading the whole file; songs without a file would have no ID at all.
+    # The price is that a moved or renamed file is a new song to the journal and play stats. Content hashes are
+    # computed on demand instead, by "Find Duplicates", which is where recordings under several paths show up.
+    return filepath if filepath else "title:" + title.lower()
+
 class MediaItem:
+    __slots__ = ('title', 'duration') # No per-instance __dict__, big libraries hold a lot of these
+
     def __init__(self, title, duration):
         self.title = title
         self.duration = duration
@@ -23,6 +38,8 @@ class MediaItem:
         return f"{self.title} - {_format_duration(self.duration)}"
 
 class Song(MediaItem):
+    __slots__ = ('artist', 'album', 'track_number', 'genre', 'filepath', 'image_path', '_id', '__play_count')
+
     def __init__(self, title, artist, album, track_number, duration, genre, filepath, image_path):
         super().__init__(title, duration)
         self.artist = artist
@@ -31,13 +48,21 @@ class Song(MediaItem):
         self.genre = genre
         self.filepath = filepath
         self.image_path = image_path
+        # For a song with a file this is the filepath string itself, so all_songs' key costs no second copy
+        self._id = make_song_id(title, filepath)
         self.__play_count = 0
+
+    @property
+    def song_id(self):
+        # The key all_songs files the song under; MusicLibrary.edit_song keeps it current
+        return self._id
         
-    def play(self):
-        self.__play_count += 1
-    
     def get_play_count(self):
         return self.__play_count
+
+    def set_play_count(self, count):
+        # For restoring the count saved by play_stats
+        self.__play_count = count
     
     def get_info(self):
         return f"{self.track_number}. {self.title} - {self.artist}"
@@ -45,39 +70,257 @@ class Song(MediaItem):
     def to_string(self):
         return (self.title, self.artist, self.album, str(self.track_number), str(self.duration), self.genre, self.filepath, self.image_path)
 
+def _album_order(song):
+    return song.track_number
+
+def _artist_order(song):
+    return (song.album, song.track_number)
+
+def _genre_order(song):
+    return (song.artist, song.album, song.track_number)
+
+# Orders the song table can be sorted by; ties fall through to the next field so every order is stable
+SORT_KEYS = {
+    "artist": lambda s: (s.artist, s.album, s.track_number),
+    "title": lambda s: (s.title.lower(), s.artist),
+    "album": lambda s: (s.album, s.track_number, s.artist),
+    "track": lambda s: (s.track_number, s.artist, s.album),
+    "duration": lambda s: (s.duration, s.artist, s.album, s.track_number),
+}
+ORDER_PATCH_LIMIT = 500 # Past this many changes between reads, a cached order is dropped and sorted again later
+
+def sort_songs(songs, sort_by="artist", reverse=False):
+    """Sorts any list of songs (an album, search results) the same way the library orders are sorted."""
+    return sorted(songs, key=SORT_KEYS[sort_by], reverse=reverse)
+
+def _index_insert(index, name, song, order):
+    """Adds a song to index[name], keeping that bucket sorted by order()."""
+    bucket = index.get(name)
+    if bucket is None:
+        index[name] = [song]
+        return True # New group
+    insort(bucket, song, key=order)
+    return False
+
+def _index_remove(index, name, song, order):
+    """Removes a song from index[name]. Returns True if the group is now empty."""
+    bucket = index.get(name)
+    if not bucket: return False
+    i = bisect_left(bucket, order(song), key=order)
+    # Several songs can share the same order key, so find the exact object
+    while i < len(bucket) and bucket[i] is not song: i += 1
+    if i < len(bucket): del bucket[i]
+    if bucket: return False
+    del index[name]
+    return True
+
+def _intern(text):
+    """Shares one copy of strings that repeat across songs (artist, album, genre, art path)."""
+    return sys.intern(text) if type(text) is str else text
+
+class LibraryChange:
+    """
+    What changed in the library, sent to subscribers after each change or once at the end of a batch().
+    A song is in at most one list: one added and then edited in the same batch is just added,
+    one added and deleted again is in none. albums holds every album name whose track list changed.
+    """
+    __slots__ = ('added', 'removed', 'updated', 'albums')
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.updated = []
+        self.albums = set()
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.updated)
+
 class MusicLibrary:
     def __init__(self):
         self.all_songs = {} 
         self.genres = set()
         self.albums = set()
+        # Secondary indexes, kept up to date by add_song/delete_song
+        self.album_index = {}   # album -> songs ordered by track number
+        self.artist_index = {}  # artist -> songs ordered by album, track
+        self.genre_index = {}   # genre -> songs ordered by artist, album, track
+        self.album_names = []   # sorted album names
+        self.search_index = SearchIndex() # Built on the first search, then kept up to date
+        self._sort_orders = {}  # sort key name -> all songs in that order, built on first use
+        self._order_patches = 0 # Changes patched into the cached orders since they were last read
+        self._listeners = []    # Called with a LibraryChange
+        self._batch_depth = 0
+        self._pending = {}      # Song -> "added" / "removed" / "updated", waiting for the batch to end
+        self._pending_albums = set()
+
+    # --- Change notifications ---
+
+    def subscribe(self, callback):
+        """callback(change) runs after every change, or once per batch()."""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners: self._listeners.remove(callback)
+
+    @contextmanager
+    def batch(self):
+        """with library.batch(): ... holds notifications back until the block ends and then sends one. Nests."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth: self._flush_changes()
+
+    def _changed(self, song, kind, *albums):
+        if not self._listeners: return
+        previous = self._pending.get(song)
+        if previous == "added":
+            if kind == "removed": del self._pending[song] # Never made it out of the batch
+        else:
+            self._pending[song] = kind
+        self._pending_albums.update(albums)
+        if not self._batch_depth: self._flush_changes()
+
+    def _flush_changes(self):
+        if not self._pending and not self._pending_albums: return
+        change = LibraryChange()
+        for song, kind in self._pending.items(): getattr(change, kind).append(song)
+        change.albums = self._pending_albums
+        self._pending = {}
+        self._pending_albums = set()
+        for callback in list(self._listeners): callback(change)
+
+    # --- Changes and queries ---
         
     def add_song(self, title, artist, album, track_number, duration, genre, filepath, image_path):
-        key = title.lower()
-        if key in self.all_songs: return f"⚠️ Song '{title}' already exists!"
+        key = make_song_id(title, filepath)
+        if key in self.all_songs:
+            if filepath: return f"⚠️ '{filepath}' is already in the library as '{self.all_songs[key].title}'!"
+            return f"⚠️ Song '{title}' already exists!"
         
-        new_song = Song(title, artist, album, track_number, duration, genre, filepath, image_path)
-        self.all_songs[key] = new_song
+        new_song = Song(title, _intern(artist), _intern(album), track_number, duration, _intern(genre), filepath, _intern(image_path))
+        self.all_songs[new_song.song_id] = new_song
         self.genres.add(genre)
         self.albums.add(album)
+        self._index_song(new_song)
+        self.search_index.add(new_song)
+        self._changed(new_song, "added", new_song.album)
         return f"✅ Added song: {new_song.title}"
     
-    def get_sorted_song_list(self):
-        songs = list(self.all_songs.values())
-        # Sort by Artist -> Album -> Track Number
-        songs.sort(key=lambda s: (s.artist, s.album, s.track_number))
-        return songs
+    @timed("library.get_sorted_song_list")
+    def get_sorted_song_list(self, sort_by="artist", reverse=False):
+        """
+        All songs in a SORT_KEYS order, as a new list. The order itself is cached and patched as songs
+        change, so this is a copy rather than a sort.
+        """
+        self._order_patches = 0
+        order = self._sort_orders.get(sort_by)
+        if order is None:
+            if sort_by == "artist":
+                # artist_index already keeps each artist's songs by album and track, only the artists need sorting
+                order = [song for artist in sorted(self.artist_index) for song in self.artist_index[artist]]
+            else:
+                order = sorted(self.all_songs.values(), key=SORT_KEYS[sort_by])
+            self._sort_orders[sort_by] = order
+        return order[::-1] if reverse else order[:]
 
+    @timed("library.get_songs_by_album")
     def get_songs_by_album(self):
-        albums = defaultdict(list)
-        for song in self.all_songs.values():
-            albums[song.album].append(song)
-        for album in albums:
-            albums[album].sort(key=lambda s: s.track_number)
-        return dict(sorted(albums.items()))
-
-    def delete_song(self, title_input):
-        key = title_input.lower()
+        # Albums are already grouped and track-ordered by the index. Tuples, so callers can't edit the index by accident
+        return {name: tuple(self.album_index[name]) for name in self.album_names}
+
+    # The lookups below copy just the one bucket into a tuple, for the same reason
+
+    @timed("library.get_album")
+    def get_album(self, album):
+        return tuple(self.album_index.get(album, ()))
+
+    @timed("library.get_songs_by_artist")
+    def get_songs_by_artist(self, artist):
+        return tuple(self.artist_index.get(artist, ()))
+
+    @timed("library.get_songs_by_genre")
+    def get_songs_by_genre(self, genre):
+        return tuple(self.genre_index.get(genre, ()))
+
+    @timed("library.search")
+    def search(self, query, limit=None, wait=True):
+        """
+        Songs whose title/artist/album/genre words start with every word in query (small typos allowed).
+        With wait=False, returns None instead of building (or waiting for) the index, which is then built in the background.
+        """
+        if wait: self.search_index.ensure_built(self.all_songs.values())
+        elif not self.search_index.built:
+            if not self.search_index.is_building(): self.search_index.build_in_background(list(self.all_songs.values()))
+            return None
+        return self.search_index.search(query, limit)
+
+    def find_by_title(self, title):
+        """Every song with this title (titles aren't unique, song ids are)."""
+        key = title.lower()
+        return [song for song in self.all_songs.values() if song.title.lower() == key]
+
+    @timed("library.delete_song")
+    def delete_song(self, song_id):
+        key = song_id
         if key in self.all_songs:
-            del self.all_songs[key]
+            song = self.all_songs.pop(key)
+            self._unindex_song(song)
+            self.search_index.remove(song)
+            self._changed(song, "removed", song.album)
             return True
-        return False
\ No newline at end of file
+        return False
+
+    @timed("library.edit_song")
+    def edit_song(self, song_id, title, artist, album, track_number, duration, genre, filepath, image_path):
+        """Updates a song in place, so its play count and any queue entries stay attached to it."""
+        old_key = song_id
+        song = self.all_songs.get(old_key)
+        if song is None: return f"⚠️ Song '{song_id}' not found!"
+        new_key = make_song_id(title, filepath)
+        if new_key != old_key and new_key in self.all_songs: return f"⚠️ '{filepath or title}' is already in the library!"
+
+        self._unindex_song(song)
+        del self.all_songs[old_key]
+        old_album = song.album
+        song.title, song.artist, song.album = title, _intern(artist), _intern(album)
+        song.track_number, song.duration, song.genre = track_number, duration, _intern(genre)
+        song.filepath, song.image_path = filepath, _intern(image_path)
+        song._id = new_key
+        self.all_songs[new_key] = song
+        self.genres.add(genre)
+        self.albums.add(album)
+        self._index_song(song)
+        self.search_index.update(song)
+        self._changed(song, "updated", old_album, song.album)
+        return f"✅ Updated song: {song.title}"
+
+    def _index_song(self, song):
+        if _index_insert(self.album_index, song.album, song, _album_order):
+            insort(self.album_names, song.album)
+        _index_insert(self.artist_index, song.artist, song, _artist_order)
+        _index_insert(self.genre_index, song.genre, song, _genre_order)
+        if self._sort_orders and self._count_order_patch():
+            for sort_by, order in self._sort_orders.items(): insort(order, song, key=SORT_KEYS[sort_by])
+
+    def _count_order_patch(self):
+        """True if the cached orders should be patched, False if they were just dropped instead (bulk changes)."""
+        self._order_patches += 1
+        if self._order_patches <= ORDER_PATCH_LIMIT: return True
+        self._sort_orders.clear()
+        return False
+
+    def _unindex_song(self, song):
+        if self._sort_orders and self._count_order_patch():
+            for sort_by, order in self._sort_orders.items():
+                key = SORT_KEYS[sort_by]
+                i = bisect_left(order, key(song), key=key)
+                while i < len(order) and order[i] is not song: i += 1 # Same key, different song
+                if i < len(order): del order[i]
+        if _index_remove(self.album_index, song.album, song, _album_order):
+            self.album_names.pop(bisect_left(self.album_names, song.album))
+            self.albums.discard(song.album)
+        _index_remove(self.artist_index, song.artist, song, _artist_order)
+        if _index_remove(self.genre_index, song.genre, song, _genre_order):
+            self.genres.discard(song.genre)
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""
+PCM Cache Module
+Keeps decoded audio of recently played songs on disk as raw PCM files, opened with mmap.
+Seeking in a cached song is just an offset into the buffer instead of decoding the file again from the start.
+Off unless the program is started with --pcm-cache or MUSICIFY_PCM_CACHE=1: it costs disk space and decoding work.
+Songs are decoded a piece at a time straight into their cache file (WAV directly, other formats through ffmpeg if
+it's installed), so memory use doesn't grow with the length of the song.
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import wave
+from collections import OrderedDict
+
+ENABLED = os.environ.get("MUSICIFY_PCM_CACHE", "") not in ("", "0") or "--pcm-cache" in sys.argv
+MAX_ENTRY_BYTES = 100 * 1024 * 1024 # Longer songs (about ten minutes of CD-quality stereo) aren't cached
+CHUNK_FRAMES = 64 * 1024            # Sample frames decoded at a time
+
+def decoded_size(seconds, mixer_format):
+    """Bytes of raw samples that many seconds take in mixer_format (pygame.mixer.get_init())."""
+    frequency, bits, channels = mixer_format
+    return int(seconds * frequency) * (abs(bits) // 8) * channels
+
+def stream_pcm(path, mixer_format):
+    """
+    An iterator of raw sample chunks of path in mixer_format, or None if it can't be decoded a piece at a time:
+    WAV files already in the mixer's format are read as they are, anything else needs ffmpeg.
+    The iterator raises OSError or ValueError if decoding fails part way.
+    """
+    frequency, bits, channels = mixer_format
+    try:
+        with wave.open(path, 'rb') as wav:
+            # 8-bit WAV is unsigned, pygame's 8-bit formats aren't, so only 16 bits and up match byte for byte
+            matches = (wav.getframerate(), -8 * wav.getsampwidth(), wav.getnchannels()) == (frequency, bits, channels)
+        if matches and bits <= -16: return _wav_chunks(path)
+    except (wave.Error, EOFError, OSError):
+        pass
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None or bits != -16: return None
+    return _ffmpeg_chunks(ffmpeg, path, frequency, channels)
+
+def _wav_chunks(path):
+    with wave.open(path, 'rb') as wav:
+        while True:
+            chunk = wav.readframes(CHUNK_FRAMES)
+            if not chunk: return
+            yield chunk
+
+def _ffmpeg_chunks(ffmpeg, path, frequency, channels):
+    process = subprocess.Popen([ffmpeg, "-v", "error", "-i", path, "-f", "s16le", "-ac", str(channels), "-ar", str(frequency), "-"],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            chunk = process.stdout.read(CHUNK_FRAMES * 2 * channels)
+            if not chunk: break
+            yield chunk
+    finally:
+        process.stdout.close()
+        if process.poll() is None: process.kill() # Stopped early, e.g. the song was too long
+        if process.wait() != 0: raise ValueError(f"ffmpeg could not decode {path}")
+
+class PcmTrack:
+    """A decoded song: mmap of raw samples in the mixer's format."""
+    def __init__(self, path, data, frequency, sample_bits, channels):
+        self.path = path
+        self.data = data
+        self.frequency = frequency
+        self.frame_bytes = abs(sample_bits) // 8 * channels
+
+    @property
+    def duration(self):
+        return self.frame_count / self.frequency
+
+    @property
+    def frame_count(self):
+        return len(self.data) // self.frame_bytes
+
+    def frame_at(self, seconds):
+        """The sample frame for a position, clamped to the track."""
+        return max(0, min(int(seconds * self.frequency), self.frame_count - 1))
+
+    def samples(self, frame, count):
+        """The raw bytes of up to count frames from frame on, without copying them out of the mmap."""
+        return memoryview(self.data)[frame * self.frame_bytes:(frame + count) * self.frame_bytes]
+
+    def close(self):
+        self.data.close()
+
+class PcmCache:
+    """
+    Least recently used songs are deleted once the files add up to more than max_bytes.
+    Files are keyed by path, size, mtime and mixer format, so an edited file or a different mixer setup decodes again.
+    Songs whose samples would take more than max_entry_bytes aren't cached.
+    """
+    def __init__(self, cache_dir=".pcm_cache", max_bytes=512 * 1024 * 1024, max_entry_bytes=MAX_ENTRY_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.used_bytes = 0
+        self._entries = OrderedDict() # file name -> size in bytes, oldest first
+        self._lock = threading.Lock() # get() runs on the engine thread, store() on the prefetch thread
+        self._scan()
+
+    def _scan(self):
+        try:
+            found = [e for e in os.scandir(self.cache_dir) if e.name.endswith(".pcm")]
+        except OSError:
+            return
+        # Files are touched when used, so mtime order is the LRU order from the last session
+        for entry in sorted(found, key=lambda e: e.stat().st_mtime_ns):
+            size = entry.stat().st_size
+            self._entries[entry.name] = size
+            self.used_bytes += size
+
+    def _file_name(self, path, mixer_format):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{mixer_format}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest() + ".pcm"
+
+    def get(self, path, mixer_format):
+        """Returns a PcmTrack, or None if the song hasn't been decoded yet. mixer_format is pygame.mixer.get_init()."""
+        name = self._file_name(path, mixer_format)
+        with self._lock:
+            if name is None or name not in self._entries: return None
+            self._entries.move_to_end(name)
+        full_path = os.path.join(self.cache_dir, name)
+        try:
+            with open(full_path, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(full_path)
+        except (OSError, ValueError): # ValueError: empty file
+            with self._lock:
+                self.used_bytes -= self._entries.pop(name, 0)
+            return None
+        return PcmTrack(path, data, *mixer_format)
+
+    def contains(self, path, mixer_format):
+        name = self._file_name(path, mixer_format)
+        with self._lock:
+            return name is not None and name in self._entries
+
+    def store(self, path, mixer_format, chunks):
+        """
+        Writes the decoded sample chunks for path to its cache file as they come, then evicts old songs until
+        the cache fits again. Returns False (and keeps nothing) if they add up to more than max_entry_bytes.
+        """
+        name = self._file_name(path, mixer_format)
+        if name is None: return False
+        full_path = os.path.join(self.cache_dir, name)
+        tmp_name = full_path + ".tmp"
+        size = 0
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_name, 'wb') as file:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_entry_bytes: break
+                    file.write(chunk)
+            if size > self.max_entry_bytes or size == 0:
+                os.remove(tmp_name)
+                return False
+            os.replace(tmp_name, full_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not cache decoded audio for {path}: {e}")
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
+            return False
+        with self._lock:
+            self.used_bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            while self.used_bytes > self.max_bytes and len(self._entries) > 1:
+                old_name, size = self._entries.popitem(last=False)
+                self.used_bytes -= size
+                try:
+                    os.remove(os.path.join(self.cache_dir, old_name))
+                except OSError:
+                    pass # Still mapped on Windows, it'll be overwritten or cleaned up later
+        return True
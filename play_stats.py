@@ -0,0 +1,205 @@
+"""
+Play Statistics Module
+Every finished or skipped song is logged to plays.log (when, how much of it was heard), and the totals
+(plays per song, artist and genre, most played, recently played) are kept up to date as it happens.
+Only songs heard at least halfway count as a play; skipped ones still show up in recently played.
+On close the totals are written to plays.json and the log starts over, so starting up reads one small
+file instead of the whole history.
+"""
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from player import escape_field, unescape_field
+
+TOP_SONGS = 100  # Most played songs kept ranked
+RECENT_PLAYS = 50
+COUNTED_FRACTION = 0.5 # Heard at least this much of the song to count as a play
+
+class PlayStats:
+    """
+    record() only updates the in-memory totals and hands a line to the writer thread, which appends
+    whatever has piled up with one flush, so playback never waits on the disk.
+    The log starts with a "#generation" line naming the snapshot it continues; a log from an older
+    generation is already counted in the snapshot and is skipped.
+    """
+    def __init__(self, log_path="plays.log", snapshot_path="plays.json"):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.counts = Counter()        # song id -> plays
+        self.artist_counts = Counter()
+        self.genre_counts = Counter()
+        self.recent = deque(maxlen=RECENT_PLAYS) # (timestamp, song id, fraction), newest last
+        self.generation = None
+        self.loaded = False
+        self._top = []           # min-heap of (plays, song id); an entry may be behind its song's real count
+        self._top_keys = set()
+        self._lines = queue.Queue()
+        self._writer = None
+
+    # --- Totals ---
+
+    def _count(self, key, artist, genre, timestamp, fraction):
+        # The same rule for new plays and replayed log lines, so restarting never changes the totals.
+        # Returns whether it counted as a play
+        self.recent.append((timestamp, key, fraction))
+        if fraction < COUNTED_FRACTION: return False
+        self.counts[key] += 1
+        self.artist_counts[artist] += 1
+        self.genre_counts[genre] += 1
+        self._update_top(key)
+        return True
+
+    def _update_top(self, key):
+        if key in self._top_keys: return # Its heap entry catches up when it reaches the bottom
+        count = self.counts[key]
+        if len(self._top) < TOP_SONGS:
+            heapq.heappush(self._top, (count, key))
+            self._top_keys.add(key)
+            return
+        while True:
+            low, low_key = self._top[0]
+            actual = self.counts[low_key]
+            if actual == low: break
+            heapq.heapreplace(self._top, (actual, low_key))
+        if count > low:
+            heapq.heapreplace(self._top, (count, key))
+            self._top_keys.discard(low_key)
+            self._top_keys.add(key)
+
+    def top_songs(self, n=10):
+        """[(song id, plays)], most played first."""
+        ranked = sorted(((self.counts[key], key) for key in self._top_keys), reverse=True)
+        return [(key, count) for count, key in ranked[:n]]
+
+    def top_artists(self, n=10):
+        return self.artist_counts.most_common(n)
+
+    def top_genres(self, n=10):
+        return self.genre_counts.most_common(n)
+
+    def recently_played(self, n=10):
+        """[(timestamp, song id, fraction)], newest first."""
+        return list(reversed(self.recent))[:n]
+
+    # --- Recording ---
+
+    def record(self, song, fraction, timestamp=None):
+        """Logs that fraction (0..1) of song was heard; it's counted as a play from COUNTED_FRACTION up."""
+        if not self.loaded: self.load()
+        timestamp = time.time() if timestamp is None else timestamp
+        fraction = min(max(fraction, 0.0), 1.0)
+        key = song.song_id
+        # The song's own count (shuffle and radio read it) follows the same rule as the totals
+        if self._count(key, song.artist, song.genre, timestamp, fraction): song.set_play_count(self.counts[key])
+        self._start_writer()
+        artist, genre, escaped_key = escape_field(song.artist), escape_field(song.genre), escape_field(key)
+        self._lines.put(f"{timestamp:.3f}|{fraction:.3f}|{artist}|{genre}|{escaped_key}\n")
+
+    def _start_writer(self):
+        if self._writer is not None: return
+        self._writer = threading.Thread(target=self._write_lines, name="PlayStatsWriter", daemon=True)
+        self._writer.start()
+
+    def _write_lines(self):
+        with open(self.log_path, 'a', encoding='utf-8', newline='\n') as file:
+            if file.tell() == 0: file.write(f"#{self.generation}\n") # load() normally wrote it already
+            while True:
+                lines = [self._lines.get()]
+                # Everything that arrived meanwhile goes out with the same flush
+                while True:
+                    try:
+                        lines.append(self._lines.get_nowait())
+                    except queue.Empty:
+                        break
+                done = None in lines
+                file.write("".join(line for line in lines if line is not None))
+                file.flush()
+                os.fsync(file.fileno())
+                if done: return
+
+    # --- Loading and saving ---
+
+    def load(self):
+        """Reads plays.json, then the plays logged since it was written. Returns how many log lines were replayed."""
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+            self.generation = snapshot["generation"]
+            self.counts = Counter(snapshot["counts"])
+            self.artist_counts = Counter(snapshot["artists"])
+            self.genre_counts = Counter(snapshot["genres"])
+            self.recent = deque((tuple(play) for play in snapshot["recent"]), maxlen=RECENT_PLAYS)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not read {self.snapshot_path} ({e}), play statistics start from the log")
+        self._top, self._top_keys = [], set()
+        for key in heapq.nlargest(TOP_SONGS, self.counts, key=self.counts.get): self._update_top(key)
+
+        self.loaded = True
+
+        replayed = 0
+        header = None
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as file:
+                header = file.readline().rstrip("\n")
+                # No snapshot yet (never closed cleanly), so the log holds everything
+                if self.generation is None and header.startswith("#"): self.generation = header[1:]
+                if header == f"#{self.generation}":
+                    for line_number, line in enumerate(file, 2):
+                        try:
+                            timestamp, fraction, *fields = line.rstrip("\n").split("|", 4)
+                            artist, genre, key = map(unescape_field, fields) # Same escaping as songs.txt
+                            self._count(key, artist, genre, float(timestamp), float(fraction))
+                            replayed += 1
+                        except ValueError:
+                            print(f"Skipped play log line {line_number}: {line.strip()}")
+        except FileNotFoundError:
+            pass
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Could not read {self.log_path} ({e})")
+        if self.generation is None: self.generation = uuid.uuid4().hex
+        if header != f"#{self.generation}":
+            # Missing, or left over from before the snapshot (already counted): start a log for this generation
+            try:
+                with open(self.log_path, 'w', encoding='utf-8', newline='\n') as file:
+                    file.write(f"#{self.generation}\n")
+            except OSError as e:
+                print(f"Could not start {self.log_path}: {e}")
+        return replayed
+
+    def restore_play_counts(self, library):
+        """Puts the saved play counts back on the library's songs. Only touches songs that were ever played."""
+        for key, count in self.counts.items():
+            song = library.all_songs.get(key)
+            if song is not None: song.set_play_count(count)
+
+    def close(self):
+        """Waits for the writer, saves the totals as plays.json and starts an empty log for the next run."""
+        if self._writer is not None:
+            self._lines.put(None)
+            self._writer.join()
+            self._writer = None
+        if not self.loaded: return # Nothing was read or recorded, so plays.json is still right
+        generation = uuid.uuid4().hex
+        snapshot = {"generation": generation, "counts": self.counts, "artists": self.artist_counts,
+                    "genres": self.genre_counts, "recent": list(self.recent)}
+        try:
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(snapshot, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # Crashing before this line is fine: the old log's generation no longer matches and gets skipped
+            with open(self.log_path, 'w', encoding='utf-8', newline='\n') as file:
+                file.write(f"#{generation}\n")
+            self.generation = generation
+        except OSError as e:
+            print(f"Could not save play statistics: {e}")
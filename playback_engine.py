@@ -0,0 +1,352 @@
+"""
+Playback Engine Module
+Runs pygame.mixer on its own thread. The GUI sends commands through a queue and hears back through signals,
+so loading a slow file or seeking never blocks the window.
+The engine also notices when a track ends and reports it, so nothing has to poll from the GUI. It goes by the
+track's real length, read from the file's headers, and only falls back to the library's duration, which can be
+missing or wrong, for formats whose headers don't say.
+The next song is read into memory while the current one plays, so the switch doesn't wait on the disk.
+Each song can be given a volume (from audio_analysis) that's applied whenever it starts.
+With a PcmCache (optional), played songs are also decoded in the background; cached songs play from a Channel
+and seeking in them doesn't decode anything. They're fed to the channel a few seconds at a time, so starting
+or seeking only copies that much out of the cache.
+pygame itself is imported on the engine thread, so it doesn't slow down opening the window.
+"""
+import io
+import os
+import queue
+import threading
+import time
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, Signal
+
+from instrumentation import span
+from metadata_probe import probe_audio
+from pcm_cache import stream_pcm, decoded_size
+
+COARSE_POLL = 1.0 # Seconds between end-of-track checks while far from the end (or if the length is unknown)
+FINE_POLL = 0.005 # ...and in the last half second, which bounds the gap between tracks
+LATE_LIMIT = 2.0  # Seconds past the expected end before going back to COARSE_POLL; the length was wrong
+PREFETCH_MAX_BYTES = 64 * 1024 * 1024 # Bigger files are only read through to warm the OS cache
+MAX_GAINS = 64 # Per-song volumes remembered; only the current and next songs really need one
+MAX_LENGTHS = 64 # Track lengths remembered, likewise
+PLAY_CHUNK = 3.0 # Seconds of a cached song handed to the mixer at a time; must be more than COARSE_POLL
+
+pygame = None # Set by the engine thread; everything that uses it runs after that
+
+class PlaybackEngine(QObject):
+    # Emitted from the engine thread, Qt delivers them on the GUI thread
+    started = Signal(object, float, float) # song, position it started from (s), time.perf_counter() when it started
+    failed = Signal(object, str)           # song, error
+    finished = Signal(object)              # song that played to the end with nothing lined up after it
+    advanced = Signal(object, object)      # song that ended, song the engine moved straight on to
+
+    def __init__(self, fade_ms=0, pcm_cache=None):
+        super().__init__()
+        self.fade_ms = fade_ms # Fade-in for automatic advances, 0 for a plain gapless switch
+        self.pcm_cache = pcm_cache
+        self.commands = queue.Queue()
+        self.latencies = deque(maxlen=500) # (command, ms from submit() until the mixer call returned)
+        self.gaps = deque(maxlen=500) # ms between last hearing a track and starting the next, on automatic advances
+        self.mixer_ready = threading.Event()
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Prefetch")
+        self._prefetch_lock = threading.Lock()
+        self._prefetched = None # (path, bytes), shared with the prefetch thread
+        self._lengths = {}      # path -> seconds from the file's headers (0 if they don't say), also filled by the prefetch thread
+        self._thread = threading.Thread(target=self._run, name="PlaybackEngine", daemon=True)
+        # Only touched on the engine thread
+        self._song = None
+        self._paused = False
+        self._expected_end = None # perf_counter() when the track should run out, None if its length is unknown
+        self._last_busy = 0.0     # perf_counter() when the mixer was last seen playing
+        self._next = None
+        self._channel = None     # Reserved mixer channel for songs played from the PCM cache
+        self._track = None       # PcmTrack of the current song, if it's playing from the cache
+        self._track_frame = 0    # First frame of the track not yet handed to the channel
+        self._gains = {}         # path -> volume 0..1 for levelled songs
+        self._gain = 1.0         # The current song's volume, fixed when it starts
+
+    def start(self):
+        """Starts the engine thread (importing pygame and opening the mixer). Safe to call more than once."""
+        if not self._thread.is_alive() and self._thread.ident is None:
+            self._thread.start()
+
+    def submit(self, command, *args):
+        """Queues a command for the engine thread, starting it if needed. Never blocks."""
+        self.start()
+        self.commands.put((command, args, time.perf_counter()))
+
+    def shutdown(self, timeout=2.0):
+        if self._thread.is_alive():
+            self.commands.put(("quit", (), time.perf_counter()))
+            self._thread.join(timeout)
+        self._prefetcher.shutdown(wait=False, cancel_futures=True)
+
+    def latency_stats(self):
+        """Returns {command: (count, average ms, max ms)} over the recent commands."""
+        grouped = defaultdict(list)
+        for command, ms in list(self.latencies): grouped[command].append(ms)
+        return {command: (len(v), sum(v) / len(v), max(v)) for command, v in grouped.items()}
+
+    def gap_stats(self):
+        """
+        Returns (count, average ms, max ms) of the gaps between tracks, or None if there weren't any.
+        Each gap runs from the last check that found the old track still playing, so it can only overstate.
+        """
+        gaps = list(self.gaps)
+        if not gaps: return None
+        return len(gaps), sum(gaps) / len(gaps), max(gaps)
+
+    # --- Engine thread ---
+
+    def _run(self):
+        global pygame
+        try:
+            import pygame as pygame_module # ~0.3 s, most of it pulling in numpy
+            pygame = pygame_module
+            pygame.mixer.init(frequency=44100)
+            if self.pcm_cache is not None:
+                pygame.mixer.set_reserved(1)
+                self._channel = pygame.mixer.Channel(0)
+        except Exception as e:
+            print(f"Error initializing Pygame mixer: {e}")
+        self.mixer_ready.set()
+        while True:
+            try:
+                command, args, submitted = self.commands.get(timeout=self._poll_timeout())
+            except queue.Empty:
+                command = None
+            if command == "quit": break
+            if command is not None: self._handle(command, args, submitted)
+            # Every time round, so a steady stream of commands can't hold back noticing the end
+            self._feed_track()
+            self._check_finished()
+        self._release_track()
+        try:
+            pygame.mixer.quit()
+        except Exception:
+            pass
+
+    def _handle(self, command, args, submitted):
+        handler = getattr(self, "_do_" + command, None)
+        if handler is None:
+            print(f"Unknown playback command: {command}")
+            return
+        try:
+            with span("engine." + command):
+                handler(*args)
+        except Exception as e: # e.g. the mixer never initialized
+            print(f"Playback error ({command}): {e}")
+        self.latencies.append((command, (time.perf_counter() - submitted) * 1000))
+
+    def _poll_timeout(self):
+        if self._song is None or self._paused: return None # Idle: sleep until the next command
+        if self._expected_end is None: return COARSE_POLL
+        remaining = self._expected_end - time.perf_counter()
+        if remaining > 0.5: return min(remaining - 0.5, COARSE_POLL)
+        if remaining > -LATE_LIMIT: return FINE_POLL
+        return COARSE_POLL
+
+    def _check_finished(self):
+        if self._song is None or self._paused: return
+        if self._busy():
+            self._last_busy = time.perf_counter()
+            return
+        # The track ran out somewhere after this; near the expected end that's at most FINE_POLL ago
+        ended_at = self._last_busy
+        song, self._song = self._song, None
+        next_song, self._next = self._next, None
+        if next_song is None:
+            self.finished.emit(song)
+            return
+        # Go straight on without a round trip through the GUI thread
+        self.advanced.emit(song, next_song)
+        self._do_play(next_song, 0.0, self.fade_ms)
+        if self._song is next_song:
+            self.gaps.append((time.perf_counter() - ended_at) * 1000)
+
+    def _busy(self):
+        if self._track is not None: return self._channel.get_busy()
+        return pygame.mixer.music.get_busy()
+
+    def _playing_from(self, song, start, duration=None):
+        if duration is None: duration = self._length(song.filepath) or song.duration
+        now = time.perf_counter()
+        self._last_busy = now
+        # A seek keeps the volume the song started with, even if a (late) analysis arrived meanwhile
+        if song is not self._song: self._gain = self._gains.get(song.filepath, 1.0)
+        self._song = song
+        self._paused = False
+        self._expected_end = now + max(duration - start, 0) if duration > 0 else None
+        self._apply_gain() # Loading a file resets the music volume, so after play()
+        self.started.emit(song, float(start), now)
+
+    def _length(self, path):
+        """Seconds of audio in path according to its headers, 0 if they don't say (e.g. not WAV or MP3)."""
+        with self._prefetch_lock:
+            length = self._lengths.get(path)
+        if length is not None: return length
+        try:
+            length = probe_audio(path).duration
+        except (OSError, ValueError):
+            length = 0.0
+        with self._prefetch_lock:
+            self._lengths[path] = length
+            if len(self._lengths) > MAX_LENGTHS: del self._lengths[next(iter(self._lengths))] # Oldest
+        return length
+
+    def _prefetch(self, path):
+        # Runs on the prefetch thread
+        self._length(path) # Headers only, so the engine doesn't read them when the song starts
+        try:
+            if os.path.getsize(path) > PREFETCH_MAX_BYTES:
+                with open(path, 'rb') as file:
+                    while file.read(1024 * 1024): pass
+                return
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return # _do_play will report it when the song comes up
+        with self._prefetch_lock:
+            self._prefetched = (path, data)
+
+    def _open_source(self, song):
+        """Returns something mixer.music.load() accepts, from memory if the song was prefetched."""
+        path = song.filepath
+        with self._prefetch_lock:
+            prefetched, self._prefetched = self._prefetched, None
+        if prefetched and prefetched[0] == path:
+            return io.BytesIO(prefetched[1]), os.path.splitext(path)[1].lstrip('.')
+        return path, ""
+
+    # --- PCM cache ---
+
+    def _cached_track(self, song):
+        """Returns the song's PcmTrack if it has been decoded, keeping it open while it plays."""
+        if self.pcm_cache is None or self._channel is None: return None
+        if self._track is not None and self._track.path == song.filepath: return self._track
+        return self.pcm_cache.get(song.filepath, pygame.mixer.get_init())
+
+    def _release_track(self):
+        if self._track is not None:
+            if self._channel is not None: self._channel.stop()
+            self._track.close()
+            self._track = None
+
+    def _play_track(self, track, song, seconds, fade_ms=0):
+        frame = track.frame_at(seconds)
+        pygame.mixer.music.stop()
+        if track is not self._track:
+            self._release_track()
+            self._track = track
+        # Jumping anywhere is just an offset into the decoded samples. Playing replaces anything queued
+        self._channel.play(self._track_chunk(frame), fade_ms=fade_ms)
+        self._feed_track()
+        # Report the position of the exact sample frame we started from
+        self._playing_from(song, frame / track.frequency, track.duration)
+
+    def _track_chunk(self, frame):
+        """A Sound of the next PLAY_CHUNK seconds of the current track from frame on."""
+        samples = self._track.samples(frame, int(PLAY_CHUNK * self._track.frequency))
+        sound = pygame.mixer.Sound(buffer=samples) # Copies this piece, so the Sound doesn't pin the mmap
+        self._track_frame = frame + len(samples) // self._track.frame_bytes
+        samples.release()
+        return sound
+
+    def _feed_track(self):
+        # The channel holds one Sound playing and one queued; once the queued one has started, queue the next.
+        # The loop wakes at least every COARSE_POLL while playing, well within a PLAY_CHUNK
+        if self._track is None or self._paused or self._track_frame >= self._track.frame_count: return
+        if self._channel.get_queue() is not None: return
+        self._channel.queue(self._track_chunk(self._track_frame)) # Plays right away if the channel already ran dry
+
+    def _queue_decode(self, song):
+        if self.pcm_cache is None or self._channel is None: return
+        mixer_format = pygame.mixer.get_init()
+        if not self.pcm_cache.contains(song.filepath, mixer_format):
+            self._prefetcher.submit(self._decode, song.filepath, mixer_format)
+
+    def _decode(self, path, mixer_format):
+        # Runs on the prefetch thread
+        size = decoded_size(self._length(path), mixer_format)
+        if size > self.pcm_cache.max_entry_bytes: return # Known to be too long, don't bother decoding it
+        chunks = stream_pcm(path, mixer_format)
+        if chunks is None:
+            # pygame only decodes whole files, into memory, so only songs known to fit in a cache entry
+            if size <= 0: return
+            try:
+                chunks = [pygame.mixer.Sound(path).get_raw()] # pygame lets go of the GIL while it decodes
+            except Exception as e:
+                print(f"Could not decode {path}: {e}")
+                return
+        self.pcm_cache.store(path, mixer_format, chunks)
+
+    def _apply_gain(self):
+        if self._track is not None: self._channel.set_volume(self._gain)
+        else: pygame.mixer.music.set_volume(self._gain)
+
+    # --- Commands ---
+
+    def _do_set_gain(self, path, gain):
+        self._gains.pop(path, None)
+        self._gains[path] = gain
+        if len(self._gains) > MAX_GAINS: del self._gains[next(iter(self._gains))] # Oldest
+        # Only used when a song starts; changing the volume of one already playing would be audible
+
+    def _do_set_next(self, song):
+        self._next = song
+        if song is not None:
+            self._prefetcher.submit(self._prefetch, song.filepath)
+
+    def _do_play(self, song, start=0.0, fade_ms=0):
+        try:
+            track = self._cached_track(song)
+            if track is not None:
+                self._play_track(track, song, start, fade_ms)
+                return
+            self._release_track()
+            source, namehint = self._open_source(song)
+            if namehint: pygame.mixer.music.load(source, namehint)
+            else: pygame.mixer.music.load(source)
+            pygame.mixer.music.play(start=start, fade_ms=fade_ms)
+            self._playing_from(song, start)
+            self._queue_decode(song)
+        except Exception as e:
+            self._song = None
+            self._next = None
+            self.failed.emit(song, str(e))
+
+    def _do_seek(self, song, seconds):
+        # Sent for the song on screen; if the engine has moved on (or stopped) since, it's no longer about this one
+        if song is not self._song: return
+        try:
+            track = self._cached_track(song)
+            if track is not None:
+                self._play_track(track, song, seconds)
+                return
+            pygame.mixer.music.play(start=seconds) # Decodes from the start of the file again
+            self._playing_from(song, seconds)
+        except Exception as e:
+            print(f"Seek error: {e}")
+
+    def _do_pause(self):
+        pygame.mixer.music.pause()
+        if self._channel is not None: self._channel.pause()
+        if not self._paused:
+            self._paused = True
+            if self._expected_end is not None: self._expected_end -= time.perf_counter() # Now holds the time left
+
+    def _do_resume(self):
+        pygame.mixer.music.unpause()
+        if self._channel is not None: self._channel.unpause()
+        if self._paused:
+            self._paused = False
+            self._last_busy = time.perf_counter()
+            if self._expected_end is not None: self._expected_end += self._last_busy
+
+    def _do_stop(self):
+        pygame.mixer.music.stop()
+        self._release_track()
+        self._song = None
+        self._next = None
@@ -1,32 +1,234 @@
 """
 Player Module (Track Number Edition)
-Handles file operations with the 8-column format.
+Handles file operations with the 8-column format, plus the append-only journal of changes made since the last save.
 """
+import os
+import re
 
+from instrumentation import timed
+
+HEADER = "TITLE|ARTIST|ALBUM|TRACK|DURATION|GENRE|FILEPATH|IMAGE_PATH"
+JOURNAL_SUFFIX = ".journal"
+# '|' and line breaks in a tag or path would split the row, so they're written as %7C, %0A and %0D
+# ('%' itself as %25). Any other '%' is left alone, so files from before this read the same.
+_ESCAPES = str.maketrans({'%': '%25', '|': '%7C', '\n': '%0A', '\r': '%0D'})
+_UNESCAPES = {'%25': '%', '%7C': '|', '%0A': '\n', '%0D': '\r'}
+_ESCAPED = re.compile('%(?:25|7C|0A|0D)')
+
+def _fsync_dir(path):
+    # Makes the rename itself durable. Directories can't be opened like this on Windows.
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@timed("player.save_songs_to_file")
 def save_songs_to_file(library, filename="songs.txt"):
+    # Write a temp file and swap it in, so a crash mid-save never leaves a truncated library
+    tmp_name = filename + ".tmp"
     try:
-        with open(filename, 'w', encoding='utf-8') as file:
-            file.write("TITLE|ARTIST|ALBUM|TRACK|DURATION|GENRE|FILEPATH|IMAGE_PATH\n")
+        with open(tmp_name, 'w', encoding='utf-8', newline='\n') as file:
+            file.write(HEADER + "\n")
             for song in library.all_songs.values():
-                line = "|".join(song.to_string())
-                file.write(line + "\n")
+                file.write(format_song_line(song) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_name, filename)
+        _fsync_dir(filename)
         return f"Saved {len(library.all_songs)} songs."
     except Exception as e:
         return f"Error: {e}"
 
-def load_songs_from_file(library, filename="songs.txt"):
+def escape_field(text):
+    return text.translate(_ESCAPES)
+
+def unescape_field(text):
+    if '%' not in text: return text
+    return _ESCAPED.sub(lambda match: _UNESCAPES[match.group()], text)
+
+def format_song_line(song):
+    """One songs.txt row (without the newline) for a song."""
+    return "|".join(map(escape_field, song.to_string()))
+
+def parse_song_line(line):
+    """Turns one songs.txt row into add_song() arguments. Raises ValueError with the reason if the row is bad."""
+    parts = line.rstrip('\r\n').split('|')
+    if len(parts) != 8:
+        raise ValueError(f"expected 8 columns, got {len(parts)}")
+    if '%' in line: parts = list(map(unescape_field, parts))
+    title, artist, album, track, duration, genre, filepath, image_path = parts
     try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            count = 0
-            for line in lines[1:]:
-                parts = line.strip().split('|')
-                if len(parts) == 8:
-                    title, artist, album, track, duration, genre, filepath, image_path = parts
-                    try:
-                        library.add_song(title, artist, album, int(track), int(duration), genre, filepath, image_path)
-                        count += 1
-                    except ValueError: pass
-        return f"Loaded {count} songs."
-    except FileNotFoundError:
-        return "No save file found."
\ No newline at end of file
+        return (title, artist, album, int(track), int(duration), genre, filepath, image_path)
+    except ValueError:
+        raise ValueError("track and duration must be whole numbers")
+
+def iter_song_batches(filename="songs.txt", batch_size=2000):
+    """
+    Streams songs.txt without reading it all into memory.
+    Yields (rows, rejected, bytes_read) per batch, where rejected is a list of (line_number, line, reason).
+    """
+    with open(filename, 'rb') as file:
+        bytes_read = len(file.readline()) # Skip the header
+        rows, rejected = [], []
+        for line_number, raw in enumerate(file, start=2):
+            bytes_read += len(raw)
+            if not raw.strip(): continue
+            try:
+                line = raw.decode('utf-8')
+                rows.append(parse_song_line(line))
+            except (UnicodeDecodeError, ValueError) as e:
+                rejected.append((line_number, raw.decode('utf-8', 'replace').rstrip('\r\n'), str(e)))
+            if len(rows) >= batch_size:
+                yield rows, rejected, bytes_read
+                rows, rejected = [], []
+        if rows or rejected:
+            yield rows, rejected, bytes_read
+
+@timed("player.add_song_rows")
+def add_song_rows(library, rows):
+    """Adds parsed rows to the library. Returns the rows that were rejected as duplicates."""
+    duplicates = []
+    with library.batch(): # One change notification for the whole list
+        for row in rows:
+            before = len(library.all_songs)
+            library.add_song(*row)
+            if len(library.all_songs) == before: duplicates.append(row)
+    return duplicates
+
+def journal_path(filename="songs.txt"):
+    return filename + JOURNAL_SUFFIX
+
+def iter_journal_records(filename="songs.txt"):
+    """
+    Reads the journal next to filename. Yields ('A', row), ('D', song_id) or ('E', old_song_id, row).
+    A torn last line from a crash mid-append is skipped.
+    """
+    path = journal_path(filename)
+    if not os.path.exists(path): return
+    with open(path, 'rb') as file:
+        for line_number, raw in enumerate(file, start=1):
+            try:
+                if not raw.endswith(b"\n"): raise ValueError("incomplete record")
+                line = raw.decode('utf-8').rstrip('\r\n')
+                op, _, rest = line.partition('|')
+                if op == 'A': yield ('A', parse_song_line(rest))
+                elif op == 'D': yield ('D', unescape_field(rest))
+                elif op == 'E':
+                    old_id, _, row = rest.partition('|')
+                    yield ('E', unescape_field(old_id), parse_song_line(row))
+                else: raise ValueError(f"unknown record type '{op}'")
+            except (UnicodeDecodeError, ValueError) as e:
+                print(f"Skipped journal line {line_number} ({e})")
+
+def _journal_song_id(library, ref):
+    # Journals written before songs had ids name the song by title
+    if ref in library.all_songs: return ref
+    matches = library.find_by_title(ref)
+    return matches[0].song_id if len(matches) == 1 else ref
+
+@timed("player.apply_journal_records")
+def apply_journal_records(library, records):
+    """Replays journal records in order. Returns how many were applied."""
+    count = 0
+    with library.batch():
+        for record in records:
+            if record[0] == 'A': library.add_song(*record[1])
+            elif record[0] == 'D': library.delete_song(_journal_song_id(library, record[1]))
+            elif record[0] == 'E': library.edit_song(_journal_song_id(library, record[1]), *record[2])
+            count += 1
+    return count
+
+class LibraryJournal:
+    """
+    Append-only log of add/delete/edit changes made since songs.txt was last written.
+    Each change is one fsynced line, so adding a song costs one small write instead of rewriting the library.
+    compact() folds the journal back into songs.txt.
+    """
+    def __init__(self, filename="songs.txt", compact_every=500):
+        self.filename = filename
+        self.path = journal_path(filename)
+        self.compact_every = compact_every
+        self.record_count = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb+') as file:
+                data = file.read()
+                if data and not data.endswith(b"\n"):
+                    # Drop a torn record so the next append starts on a fresh line
+                    file.truncate(data.rfind(b"\n") + 1)
+                self.record_count = data.count(b"\n")
+        self._file = None
+
+    @timed("player.journal_append")
+    def _append(self, lines):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8', newline='\n')
+        self._file.write("".join(line + "\n" for line in lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.record_count += len(lines)
+
+    def append_add(self, song):
+        self.append_adds([song])
+
+    def append_adds(self, songs):
+        """Logs several added songs with a single fsync."""
+        if songs: self._append(["A|" + format_song_line(song) for song in songs])
+
+    def append_delete(self, song_id):
+        self._append([f"D|{escape_field(song_id)}"])
+
+    def append_edit(self, old_song_id, song):
+        self._append([f"E|{escape_field(old_song_id)}|" + format_song_line(song)])
+
+    def needs_compaction(self):
+        return self.record_count >= self.compact_every
+
+    @timed("player.journal_compact")
+    def compact(self, library):
+        """Writes the whole library to songs.txt atomically, then empties the journal."""
+        if self.record_count == 0: return "Nothing to compact."
+        message = save_songs_to_file(library, self.filename)
+        if message.startswith("Error"): return message
+        # If we crash before this truncate, replaying the old records over the new file is harmless
+        self.close()
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.flush()
+            os.fsync(file.fileno())
+        self.record_count = 0
+        return message
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+@timed("player.load_songs_from_file")
+def load_songs_from_file(library, filename="songs.txt"):
+    has_base = os.path.exists(filename)
+    if not has_base and not os.path.exists(journal_path(filename)):
+        return "No save file found."
+    count = 0
+    rejected = 0
+    batches = iter_song_batches(filename) if has_base else []
+    for rows, bad_rows, _ in batches:
+        for line_number, line, reason in bad_rows:
+            print(f"Skipped line {line_number} ({reason}): {line}")
+        duplicates = add_song_rows(library, rows)
+        for row in duplicates:
+            print(f"Skipped duplicate song: {row[0]}")
+        count += len(rows) - len(duplicates)
+        rejected += len(bad_rows) + len(duplicates)
+    # Changes made since the last full save
+    replayed = apply_journal_records(library, iter_journal_records(filename))
+    if replayed: count = len(library.all_songs)
+    notes = []
+    if rejected: notes.append(f"{rejected} rejected")
+    if replayed: notes.append(f"{replayed} journal records")
+    if notes: return f"Loaded {count} songs ({', '.join(notes)})."
+    return f"Loaded {count} songs."
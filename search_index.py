@@ -0,0 +1,298 @@
+"""
+Search Index Module
+Inverted index over title/artist/album/genre words for the search box.
+Every query word matches as a prefix, so results show up while typing, and a word that matches nothing
+falls back to vocabulary words with similar trigrams, so small typos still find the song.
+Queries only ever look at postings: the sorted postings of every query word are walked together, each one
+jumping ahead to where the others are with a binary search (a leapfrog join).
+"""
+import gc
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import islice
+
+_WORD = re.compile(r"\w+")
+FUZZY_MIN_SCORE = 0.45 # Share of trigrams two words need in common to count as a typo of each other
+FUZZY_SHORT_WORD = 5   # Shorter misspelled words must be one edit away from the words they're matched to
+FUZZY_MAX_WORDS = 5    # Similar words tried per misspelled query word
+MAX_EXPANSION = 5000   # A prefix matching more words than this gets its own merged posting instead
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+def _trigrams(word):
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """
+    Songs get a doc id in the order they're added. Postings are compact, sorted arrays of doc ids;
+    removed songs leave a hole that queries skip until enough of them pile up to rebuild.
+    The first build can run on a background thread; changes made meanwhile are applied once it's done.
+    """
+    def __init__(self):
+        self.built = False
+        self._lock = threading.Lock()
+        self._building = None  # Event while a background build runs
+        self._pending = []     # ("add" | "remove", song) that arrived during that build
+        self._install([], {}, {}, {})
+
+    def _install(self, songs, doc_ids, postings, trigrams, vocab=None, prefixes=None):
+        self._songs = songs         # doc id -> Song, None once removed
+        self._doc_ids = doc_ids     # Song -> doc id
+        self._postings = postings   # word -> array of doc ids
+        self._trigrams = trigrams   # trigram -> words containing it (numbers are left out)
+        self._vocab = sorted(postings) if vocab is None else vocab # sorted words, for prefix lookups
+        self._new_words = []        # words added since _vocab was last sorted
+        self._prefixes = prefixes or {} # prefix -> array of docs, for prefixes that match more than MAX_EXPANSION words
+        self._removed = 0
+
+    # --- Building ---
+
+    def build(self, songs):
+        """Indexes songs from scratch. Shared fields (artist/album/genre) are only split into words once per value."""
+        # Millions of small objects and no reference cycles: the cycle collector walking them over and over
+        # was half the build time, and it holds the GIL, so the window froze for up to 0.9 s at a time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self._build(list(songs))
+        finally:
+            if collecting: gc.enable()
+
+    def _build(self, songs):
+        doc_ids = {song: doc for doc, song in enumerate(songs)}
+        postings = defaultdict(list)
+        groups = defaultdict(list) # artist/album/genre value -> docs
+        for doc, song in enumerate(songs):
+            for word in set(_WORD.findall(song.title.lower())): postings[word].append(doc)
+            groups[song.artist].append(doc)
+            groups[song.album].append(doc)
+            groups[song.genre].append(doc)
+        mixed = set() # Words that got docs from more than one place, so they may be out of order or doubled
+        for value, docs in groups.items():
+            for word in set(tokenize(value)):
+                if word in postings: mixed.add(word)
+                postings[word].extend(docs)
+        final = {}
+        trigrams = defaultdict(list)
+        for word, docs in postings.items():
+            final[word] = array('I', sorted(set(docs)) if word in mixed else docs)
+            if not word.isdigit():
+                for trigram in _trigrams(word): trigrams[trigram].append(word)
+        vocab = sorted(final)
+        prefixes = {prefix: _merge(final[word] for word in vocab[start:end]) for prefix, start, end in _common_prefixes(vocab)}
+        with self._lock:
+            self._install(songs, doc_ids, final, dict(trigrams), vocab, prefixes)
+            self.built = True
+            pending, self._pending = self._pending, []
+            for op, song in pending:
+                if op == "add": self._add(song)
+                else: self._remove(song)
+            building, self._building = self._building, None
+        if building: building.set()
+
+    def build_in_background(self, songs):
+        """Starts build() on a thread. Pass a snapshot (e.g. list(library.all_songs.values()))."""
+        with self._lock:
+            if self.built or self._building: return
+            self._building = threading.Event()
+        threading.Thread(target=self.build, args=(songs,), name="SearchIndex", daemon=True).start()
+
+    def is_building(self):
+        return self._building is not None
+
+    def wait_until_built(self):
+        building = self._building
+        if building: building.wait()
+
+    def ensure_built(self, songs):
+        """Builds right here unless that already happened or a background build is running (then waits for it)."""
+        if self.built: return
+        if self._building: self.wait_until_built()
+        else: self.build(songs)
+
+    # --- Updates (ignored until the index is built, build() picks everything up) ---
+
+    def add(self, song):
+        with self._lock:
+            if self._building: self._pending.append(("add", song))
+            elif self.built: self._add(song)
+
+    def remove(self, song):
+        with self._lock:
+            if self._building: self._pending.append(("remove", song))
+            elif self.built: self._remove(song)
+
+    def update(self, song):
+        """Call after a song's fields changed."""
+        self.remove(song)
+        self.add(song)
+
+    def _add(self, song):
+        doc = len(self._songs)
+        self._songs.append(song)
+        self._doc_ids[song] = doc
+        words = set(tokenize(f"{song.title} {song.artist} {song.album} {song.genre}"))
+        for prefix, docs in self._prefixes.items():
+            if any(word.startswith(prefix) for word in words): docs.append(doc)
+        for word in words:
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = array('I')
+                self._new_words.append(word)
+                if not word.isdigit():
+                    for trigram in _trigrams(word): self._trigrams.setdefault(trigram, []).append(word)
+            posting.append(doc)
+
+    def _remove(self, song):
+        doc = self._doc_ids.pop(song, None)
+        if doc is None: return
+        self._songs[doc] = None
+        self._removed += 1
+        if self._removed > 1000 and self._removed * 4 > len(self._songs):
+            # Start over with only the live songs (the lock is already held, so not through build())
+            live = [s for s in self._songs if s is not None]
+            self._install([], {}, {}, {})
+            for s in live: self._add(s)
+            self._sorted_vocab()
+
+    # --- Queries ---
+
+    def _sorted_vocab(self):
+        if self._new_words:
+            if len(self._new_words) > 256: self._vocab = sorted(self._postings)
+            else:
+                for word in self._new_words: insort(self._vocab, word)
+            self._new_words = []
+        return self._vocab
+
+    def _expand(self, prefix):
+        """Words starting with prefix, or None if there are more than MAX_EXPANSION of them."""
+        vocab = self._sorted_vocab()
+        start = bisect_left(vocab, prefix)
+        end = bisect_left(vocab, _after_prefix(prefix), start)
+        if end - start > MAX_EXPANSION: return None
+        return vocab[start:end]
+
+    def _prefix_docs(self, prefix):
+        """Docs with a word starting with prefix, for prefixes too common to expand. Merged once, then kept up to date."""
+        docs = self._prefixes.get(prefix)
+        if docs is None:
+            vocab = self._sorted_vocab()
+            start = bisect_left(vocab, prefix)
+            end = bisect_left(vocab, _after_prefix(prefix), start)
+            docs = self._prefixes[prefix] = _merge(self._postings[word] for word in vocab[start:end])
+        return docs
+
+    def _fuzzy(self, word):
+        if len(word) < 3: return []
+        wanted = _trigrams(word)
+        shared = Counter()
+        for trigram in wanted: shared.update(self._trigrams.get(trigram, ()))
+        # One typo can spoil three trigrams, which is most of a short word's, so short words need fewer in common
+        # and are checked letter by letter instead
+        min_score = min(FUZZY_MIN_SCORE, (len(word) - 3) / (len(word) + 1))
+        scored = []
+        for candidate, count in shared.items():
+            # A word of n letters has about n padded trigrams
+            score = count / max(len(wanted), len(candidate))
+            if score < min_score: continue
+            if len(word) < FUZZY_SHORT_WORD and not _one_edit_apart(word, candidate): continue
+            scored.append((score, candidate))
+        scored.sort(reverse=True)
+        return [candidate for _, candidate in scored[:FUZZY_MAX_WORDS]]
+
+    def search(self, query, limit=None):
+        """
+        Returns the songs matching every word of query, in the order they were indexed, or None if the
+        index isn't built yet. Stops after limit songs if one is given. Call from the thread that changes the library.
+        """
+        words = tokenize(query)
+        if not words: return []
+        if not self.built: return None
+        groups = [] # Per query word, the sorted postings of the words that match it
+        for word in words:
+            matches = self._expand(word)
+            if matches is None: # Very short prefix, matching too many words to go through one by one
+                groups.append([self._prefix_docs(word)])
+                continue
+            if not matches: matches = self._fuzzy(word)
+            if not matches: return []
+            groups.append([self._postings[m] for m in matches])
+        songs = self._songs
+        # Query words in every song (e.g. "artist") don't narrow anything down
+        groups = [postings for postings in groups if max(map(len, postings)) < len(songs)]
+        if not groups: return list(islice((song for song in songs if song is not None), limit))
+        # One sorted array per query word, shortest first so the first leaps are the long ones
+        postings = sorted((group[0] if len(group) == 1 else _merge(group) for group in groups), key=len)
+        if len(postings) == 1:
+            return list(islice((songs[doc] for doc in postings[0] if songs[doc] is not None), limit))
+        return _leapfrog(postings, songs, limit)
+
+def _leapfrog(postings, songs, limit):
+    """
+    Songs whose doc is in every one of postings, in doc order.
+    Each posting in turn is asked for its first doc at or after the current one, by a binary search that starts
+    where its last one ended. A doc they all agree on is a match; otherwise the search leaps to the larger doc,
+    so a run of docs that only some query words have is skipped in one step.
+    """
+    cursors = [0] * len(postings)
+    results = []
+    doc = agreed = i = 0
+    while True:
+        posting = postings[i]
+        at = cursors[i] = bisect_left(posting, doc, cursors[i])
+        if at == len(posting): return results
+        found = posting[at]
+        if found == doc: agreed += 1
+        else:
+            doc = found
+            agreed = 1
+        if agreed == len(postings):
+            song = songs[doc]
+            if song is not None:
+                results.append(song)
+                if limit is not None and len(results) >= limit: return results
+            doc += 1
+            agreed = 0
+        i = i + 1 if i + 1 < len(postings) else 0
+
+def _after_prefix(prefix):
+    # The first string past every word that starts with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def _common_prefixes(vocab, start=0, end=None, length=1):
+    """(prefix, start, end) of the ranges of sorted vocab whose words share a prefix of up to 3 letters, if they're over MAX_EXPANSION."""
+    end = len(vocab) if end is None else end
+    found = []
+    i = start
+    while i < end:
+        if len(vocab[i]) < length: # The prefix itself, e.g. "5" among the words under "5"
+            i += 1
+            continue
+        prefix = vocab[i][:length]
+        j = bisect_left(vocab, _after_prefix(prefix), i, end)
+        if j - i > MAX_EXPANSION:
+            found.append((prefix, i, j))
+            if length < 3: found.extend(_common_prefixes(vocab, i, j, length + 1))
+        i = j
+    return found
+
+def _merge(postings):
+    """One sorted array of the docs in any of postings."""
+    docs = set()
+    for posting in postings: docs.update(posting)
+    return array('I', sorted(docs))
+
+def _one_edit_apart(a, b):
+    """Whether b is a with one letter changed, added, dropped, or two neighbours swapped."""
+    if a == b or abs(len(a) - len(b)) > 1: return a == b
+    if len(a) > len(b): a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]: i += 1
+    if len(a) < len(b): return a[i:] == b[i + 1:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:])
@@ -0,0 +1,85 @@
+"""
+Shuffle Module
+Plays a list in random order without shuffling (or even copying) the list first.
+LazyShuffle is a Fisher-Yates shuffle done one step at a time: each next() picks one of the
+songs not played yet, and only the positions it swapped are remembered.
+"""
+import random
+from collections import deque
+
+CANDIDATES = 4 # Songs looked at per pick when weighting by play count or avoiding artists
+
+class LazyShuffle:
+    """
+    Every song in songs comes up exactly once, in a random order, then next() returns None.
+    songs is read, not copied, so it must not change while the shuffle runs; pass a tuple of a list that can.
+
+    seed: the same seed over the same list gives the same order (a random one is picked and kept in .seed otherwise).
+    avoid_artists: don't pick an artist heard in the last this many songs, as long as some other artist is left to pick.
+    weighted: songs with more plays come up sooner.
+    """
+    def __init__(self, songs, seed=None, avoid_artists=3, weighted=False):
+        self.songs = songs
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self._random = random.Random(self.seed)
+        self._size = len(songs)
+        self._drawn = 0   # Positions before this one hold songs already played
+        self._swapped = {} # position -> index of the song now there, for positions the shuffle moved
+        self._recent = deque(maxlen=avoid_artists) if avoid_artists > 0 else None
+        self.weighted = weighted
+        self._discarded = set() # Songs deleted from the library since; skipped when they come up
+
+    def remaining(self):
+        return self._size - self._drawn
+
+    def next(self):
+        """The next song, or None once every song has come up. O(1)."""
+        while self._drawn < self._size:
+            position = self._pick()
+            # Swap the pick into the next drawn slot; the slot itself is never looked at again
+            index = self._swapped.pop(position, position)
+            if position != self._drawn:
+                self._swapped[position] = self._swapped.pop(self._drawn, self._drawn)
+            self._drawn += 1
+            if index < len(self.songs):
+                song = self.songs[index]
+                if song in self._discarded: continue
+                if self._recent is not None: self._recent.append(song.artist)
+                return song
+        return None
+
+    def discard(self, songs):
+        """Makes sure songs never come up (e.g. they were deleted from the library)."""
+        self._discarded.update(songs)
+
+    def take(self, count):
+        """Up to count next songs."""
+        songs = []
+        while len(songs) < count:
+            song = self.next()
+            if song is None: break
+            songs.append(song)
+        return songs
+
+    def _song_at(self, position):
+        index = self._swapped.get(position, position)
+        return self.songs[index] if index < len(self.songs) else None
+
+    def _pick(self):
+        """A position from the not-yet-drawn part, looking at a few candidates if artists or weights matter."""
+        randrange, start, end = self._random.randrange, self._drawn, self._size
+        if not self.weighted and not self._recent:
+            return randrange(start, end)
+        best, best_score = None, -1.0
+        for _ in range(CANDIDATES):
+            position = randrange(start, end)
+            song = self._song_at(position)
+            if song is None: return position
+            if self._recent and song.artist in self._recent:
+                if best is None: best = position # Better than nothing if every candidate is a recent artist
+                continue
+            if not self.weighted: return position
+            # Weighted pick among the candidates: the largest random() ** (1 / weight) wins
+            score = self._random.random() ** (1.0 / (1 + song.get_play_count()))
+            if score > best_score: best, best_score = position, score
+        return best
@@ -0,0 +1,202 @@
+"""
+Similarity Module
+Finds songs that belong together, for the "Radio" mode that keeps playing after the queue runs out.
+Every song is a feature vector: one-hot blocks for its artist, album and genre, plus its length and how often
+it's been played. The vectors live in NumPy arrays with a column per song, so scoring the whole library against
+a few seed songs is a handful of vectorized operations and an argpartition. The arrays are filled on a thread
+(a second or two for a million songs) and then follow library changes.
+Without NumPy there's no index and no radio. NumPy is only imported when the first index is built, so it
+doesn't slow down opening the window.
+"""
+import gc
+import importlib.util
+import math
+import threading
+
+numpy = None # Imported by the first SimilarityIndex
+
+FIELDS = ("artist", "album", "genre")
+FIELD_WEIGHTS = (1.0, 0.8, 0.6)  # Of each one-hot block
+DURATION_WEIGHT = 0.3
+PLAYS_WEIGHT = 0.3
+SHORT_SONG, LONG_SONG = 60, 900 # Seconds; durations are compared on a log scale between these
+SEED_DECAY = 0.5                # Each older seed counts this much less than the one after it
+BUILD_SLICE = 20000             # Songs build() adds at a time
+
+def numpy_available():
+    """Whether NumPy is installed, without importing it."""
+    return importlib.util.find_spec("numpy") is not None
+
+class SimilarityIndex:
+    """
+    Ranks songs by the cosine similarity of their feature vectors.
+    The one-hot blocks are stored as one integer code per field: their dot product with another song's is
+    the field weight squared if the codes match and 0 otherwise, so it's an equality test over an int array,
+    exact for any number of artists. Subscribes itself to the library; call close() to stop following it.
+    Starts out empty: call build() or build_in_background().
+    """
+    def __init__(self, library):
+        global numpy
+        import numpy # Raises ImportError without it; check numpy_available() first
+        self.library = library
+        self.codes = numpy.zeros((len(FIELDS), 0), numpy.int32)  # Field value codes, a column per song
+        self.dense = numpy.zeros((3, 0), numpy.float32)          # Duration (two) and play count features
+        self.inverse_norm = numpy.zeros(0, numpy.float32)        # 1 / length of each song's whole vector
+        self.alive = numpy.zeros(0, bool) # Columns of deleted songs stay until reused
+        self._columns = {} # song -> column
+        self._songs = []   # column -> song, None for a free column
+        self._free = []
+        self._values = [{} for _ in FIELDS] # value -> code, per field
+        self.built = False
+        self._lock = threading.Lock()
+        self._building = None # Event while a background build runs
+        self._pending = []    # Library changes that arrived during that build
+        library.subscribe(self.on_library_changed)
+
+    def build(self, songs=None):
+        """Indexes songs (by default the whole library). Songs it already has are left alone."""
+        # Lots of small tuples and lists and no reference cycles, same as SearchIndex.build
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            songs = list(self.library.all_songs.values()) if songs is None else songs
+            self._reserve(len(self._songs) + len(songs))
+            # A slice at a time: set(), dict.update() and fromiter() over a million songs are each one call
+            # that holds the GIL until it's done, and the window can't repaint meanwhile
+            for start in range(0, len(songs), BUILD_SLICE): self.add(songs[start:start + BUILD_SLICE])
+        finally:
+            if collecting: gc.enable()
+        with self._lock:
+            self.built = True
+            pending, self._pending = self._pending, []
+            for change in pending: self._apply(change)
+            building, self._building = self._building, None
+        if building: building.set()
+
+    def build_in_background(self):
+        """Starts build() on a thread. Until it's done similar() finds nothing and library changes wait for it."""
+        with self._lock:
+            if self.built or self._building: return
+            self._building = threading.Event()
+        # Snapshot here, after _building is set, so every later change ends up in _pending instead
+        songs = list(self.library.all_songs.values())
+        threading.Thread(target=self.build, args=(songs,), name="SimilarityIndex", daemon=True).start()
+
+    def is_building(self):
+        return self._building is not None
+
+    def wait_until_built(self):
+        building = self._building
+        if building: building.wait()
+
+    def close(self):
+        self.library.unsubscribe(self.on_library_changed)
+
+    def __len__(self):
+        return len(self._columns)
+
+    # --- Keeping up with the library ---
+
+    def on_library_changed(self, change):
+        with self._lock:
+            if self._building:
+                self._pending.append(change)
+                return
+        self._apply(change)
+
+    def _apply(self, change):
+        for song in change.removed: self.remove(song)
+        self.add(change.added)
+        self.update(change.updated)
+
+    def add(self, songs):
+        songs = [song for song in songs if song not in self._columns]
+        reused = self._free[len(self._free) - len(songs):] if songs else []
+        del self._free[len(self._free) - len(reused):]
+        columns = reused + list(range(len(self._songs), len(self._songs) + len(songs) - len(reused)))
+        self._songs.extend([None] * (len(songs) - len(reused)))
+        for song, column in zip(songs, columns): self._songs[column] = song
+        self._columns.update(zip(songs, columns))
+        self._reserve(len(self._songs))
+        self._fill(columns)
+
+    def remove(self, song):
+        column = self._columns.pop(song, None)
+        if column is None: return
+        self._songs[column] = None
+        self.alive[column] = False
+        self._free.append(column)
+
+    def update(self, songs):
+        """Recomputes the vectors of songs that were edited (or played, for the play count)."""
+        if self._building: return # The build thread owns the arrays until it's done
+        self._fill([self._columns[song] for song in songs if song in self._columns])
+
+    def _reserve(self, size):
+        capacity = len(self.alive)
+        if size <= capacity: return
+        capacity = max(1024, size, capacity * 2) # Doubling, so adding one song at a time stays cheap
+        def grown(array):
+            bigger = numpy.zeros(array.shape[:-1] + (capacity,), array.dtype)
+            bigger[..., :array.shape[-1]] = array
+            return bigger
+        self.codes, self.dense = grown(self.codes), grown(self.dense)
+        self.inverse_norm, self.alive = grown(self.inverse_norm), grown(self.alive)
+
+    def _code_array(self, field, keys):
+        """Codes for keys, numbering each value the first time it's seen."""
+        codes = self._values[field]
+        for key in set(keys).difference(codes): codes[key] = len(codes)
+        return numpy.fromiter(map(codes.__getitem__, keys), numpy.int32, len(keys))
+
+    def _fill(self, columns):
+        """Writes the vectors of the songs at columns."""
+        if not columns: return
+        songs = [self._songs[column] for column in columns]
+        self.codes[0, columns] = self._code_array(0, [song.artist for song in songs])
+        # Albums are told apart by artist too, or every "Greatest Hits" would look alike
+        self.codes[1, columns] = self._code_array(1, [(song.artist, song.album) for song in songs])
+        self.codes[2, columns] = self._code_array(2, [song.genre for song in songs])
+        # Duration as an angle, so similar lengths point the same way
+        durations = numpy.fromiter((song.duration for song in songs), numpy.float32, len(songs))
+        angle = numpy.clip(numpy.log(numpy.maximum(durations, 1) / SHORT_SONG) / math.log(LONG_SONG / SHORT_SONG), 0, 1) * (math.pi / 2)
+        plays = numpy.fromiter((song.get_play_count() for song in songs), numpy.float32, len(songs))
+        dense = numpy.stack((DURATION_WEIGHT * numpy.cos(angle), DURATION_WEIGHT * numpy.sin(angle),
+                             PLAYS_WEIGHT * numpy.minimum(numpy.log1p(plays) / 5, 1)))
+        self.dense[:, columns] = dense
+        one_hot = sum(weight * weight for weight in FIELD_WEIGHTS) # Every song has exactly one value per field
+        self.inverse_norm[columns] = 1 / numpy.sqrt(one_hot + numpy.square(dense).sum(axis=0))
+        self.alive[columns] = True
+
+    # --- Queries ---
+
+    def similar(self, seeds, count, exclude=()):
+        """
+        Up to count songs most like seeds (the first counts most), best first.
+        The seeds themselves and the songs in exclude are never returned.
+        """
+        if self._building: return []
+        seed_columns = [self._columns[song] for song in seeds if song in self._columns]
+        if not seed_columns or count <= 0: return []
+        size = len(self._songs)
+        # Dot products with the weighted sum of the seeds' vectors; dividing by its length wouldn't change the order
+        seed_weights = numpy.array([SEED_DECAY ** i for i in range(len(seed_columns))], numpy.float32)
+        seed_weights *= self.inverse_norm[seed_columns]
+        scores = (self.dense[:, seed_columns] @ seed_weights) @ self.dense[:, :size]
+        for field, field_weight in enumerate(FIELD_WEIGHTS):
+            # What a song sharing each value with the seeds scores, so the library is read once per field
+            # (seeds sharing a value add up, as they did when every seed was compared on its own)
+            table = numpy.zeros(len(self._values[field]), numpy.float32)
+            numpy.add.at(table, self.codes[field, seed_columns], field_weight * field_weight * seed_weights)
+            scores += table.take(self.codes[field, :size], mode='clip') # Every code is in range; clip skips checking
+        scores *= self.inverse_norm[:size]
+        scores[~self.alive[:size]] = -numpy.inf
+        scores[seed_columns] = -numpy.inf
+        skip = [self._columns[song] for song in exclude if song in self._columns]
+        if skip: scores[skip] = -numpy.inf
+        count = min(count, len(self._columns) - len(set(seed_columns).union(skip)))
+        if count <= 0: return []
+        # Only the best count songs get sorted, not the whole library
+        best = numpy.argpartition(scores, size - count)[size - count:]
+        best = best[numpy.argsort(scores[best])[::-1]]
+        return [self._songs[column] for column in best]
@@ -0,0 +1,86 @@
+"""
+Songs whose tags or paths contain the row separator or a line break survive a save and a reload.
+
+    python -m unittest discover tests
+"""
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from music_library import MusicLibrary
+from player import LibraryJournal, load_songs_from_file
+from folder_import import probe_to_row
+
+def write_tagged_wav(path, tags):
+    """One second of silence with a LIST/INFO chunk holding tags ({b"IART": "AC|DC", ...})."""
+    info = b"INFO"
+    for tag, value in tags.items():
+        data = value.encode('utf-8') + b"\0"
+        if len(data) & 1: data += b"\0"
+        info += struct.pack('<4sI', tag, len(data)) + data
+    fmt = struct.pack('<HHIIHH', 1, 1, 8000, 16000, 2, 16)
+    body = (b"WAVE" + b"fmt " + struct.pack('<I', len(fmt)) + fmt
+            + b"LIST" + struct.pack('<I', len(info)) + info
+            + b"data" + struct.pack('<I', 16000) + bytes(16000))
+    with open(path, 'wb') as file:
+        file.write(b"RIFF" + struct.pack('<I', len(body)) + body)
+
+class SongRowTests(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.songs_file = os.path.join(self.folder.name, "songs.txt")
+        music = os.path.join(self.folder.name, "AC|DC\nLive")
+        os.mkdir(music)
+        self.path = os.path.join(music, "01 Highway.wav").replace('\\', '/')
+        write_tagged_wav(self.path, {b"INAM": "Highway|To\nHell", b"IART": "AC|DC", b"IPRD": "100% Live"})
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def reload(self):
+        library = MusicLibrary()
+        load_songs_from_file(library, self.songs_file)
+        return library
+
+    def test_import_then_reload(self):
+        row = probe_to_row(self.path)
+        self.assertEqual(row[1], "AC|DC")
+        library = MusicLibrary()
+        library.add_song(*row)
+        journal = LibraryJournal(self.songs_file)
+        journal.append_adds(list(library.all_songs.values()))
+        journal.close()
+
+        # From the journal, then from songs.txt once it's compacted
+        for _ in range(2):
+            reloaded = self.reload()
+            self.assertEqual(len(reloaded.all_songs), 1)
+            song = reloaded.all_songs[self.path]
+            self.assertEqual((song.title, song.artist, song.album, song.filepath),
+                             ("Highway|To\nHell", "AC|DC", "100% Live", self.path))
+            journal = LibraryJournal(self.songs_file)
+            journal.compact(reloaded)
+            journal.close()
+
+    def test_edit_and_delete_records(self):
+        library = MusicLibrary()
+        library.add_song(*probe_to_row(self.path))
+        journal = LibraryJournal(self.songs_file)
+        journal.append_adds(list(library.all_songs.values()))
+        song = library.all_songs[self.path]
+        library.edit_song(self.path, "Renamed", "AC|DC", song.album, 1, song.duration, "", self.path, "")
+        journal.append_edit(self.path, song)
+        journal.close()
+        self.assertEqual(self.reload().all_songs[self.path].title, "Renamed")
+
+        journal = LibraryJournal(self.songs_file)
+        journal.append_delete(self.path)
+        journal.close()
+        self.assertEqual(len(self.reload().all_songs), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Thumbnail Cache Module
+Album art is decoded and scaled on worker threads, kept in a byte-limited LRU in memory
+and saved as small PNGs on disk so the next start doesn't decode the originals again.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QSize, Qt, Signal
+from PySide6.QtGui import QColor, QImage, QImageReader, QPixmap
+
+from instrumentation import timed
+
+ALBUM_SIZE = 140
+NOW_PLAYING_SIZE = 60
+MISSING_RETRY = 60 # Seconds before art that couldn't be read is tried again (it may have been copied in since)
+
+class _DecodeSignals(QObject):
+    done = Signal(str, int, QImage) # path, size, image (null if it couldn't be read)
+
+class _DecodeTask(QRunnable):
+    def __init__(self, path, size, cache_dir, signals):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.cache_dir = cache_dir
+        self.signals = signals
+
+    def run(self):
+        self.signals.done.emit(self.path, self.size, self.load())
+
+    @timed("thumbnails.decode")
+    def load(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return QImage()
+        # Disk thumbnails are keyed by path and mtime, so edited art gets re-scaled
+        key = hashlib.sha1(f"{self.path}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}".encode('utf-8')).hexdigest()
+        cached = os.path.join(self.cache_dir, key + ".png")
+        image = QImage(cached) if os.path.exists(cached) else QImage()
+        if not image.isNull(): return image
+
+        reader = QImageReader(self.path)
+        full = reader.size()
+        if full.isValid():
+            # Lets the JPEG decoder skip detail we'd throw away anyway
+            reader.setScaledSize(full.scaled(QSize(self.size, self.size), Qt.AspectRatioMode.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull(): return image
+        if image.width() > self.size or image.height() > self.size:
+            image = image.scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            image.save(cached, "PNG")
+        except OSError:
+            pass
+        return image
+
+class ThumbnailCache(QObject):
+    """
+    get() returns a ready QPixmap or None. On None a decode is queued and
+    thumbnail_ready(path, size) fires once it's available.
+    Pixmaps are kept by path, so call invalidate() when the file at a path may have changed.
+    """
+    thumbnail_ready = Signal(str, int)
+
+    def __init__(self, cache_dir=".thumbnails", max_bytes=32 * 1024 * 1024, parent=None):
+        super().__init__(parent)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._pixmaps = OrderedDict() # (path, size) -> QPixmap, oldest first
+        self._pending = set()
+        self._missing = {}            # (path, size) that couldn't be read -> when, so we don't keep retrying them
+        self._placeholders = {}
+        self._signals = _DecodeSignals()
+        self._signals.done.connect(self._on_decoded)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(2)
+
+    def get(self, path, size):
+        if not path: return None
+        key = (path, size)
+        failed_at = self._missing.get(key)
+        if failed_at is not None:
+            if time.monotonic() - failed_at < MISSING_RETRY: return None
+            del self._missing[key]
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+            return pixmap
+        if key not in self._pending:
+            self._pending.add(key)
+            self._pool.start(_DecodeTask(path, size, self.cache_dir, self._signals))
+        return None
+
+    def placeholder(self, size):
+        pixmap = self._placeholders.get(size)
+        if pixmap is None:
+            pixmap = QPixmap(size, size)
+            pixmap.fill(QColor("#22303C"))
+            self._placeholders[size] = pixmap
+        return pixmap
+
+    def invalidate(self, paths):
+        """Forgets the thumbnails of these image paths, so they're decoded again (from disk if the file changed)."""
+        paths = set(paths)
+        if not paths: return
+        for key in [k for k in self._pixmaps if k[0] in paths]:
+            self.used_bytes -= self._cost(self._pixmaps.pop(key))
+        for key in [k for k in self._missing if k[0] in paths]:
+            del self._missing[key]
+
+    def _cost(self, pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def _on_decoded(self, path, size, image):
+        key = (path, size)
+        self._pending.discard(key)
+        if image.isNull():
+            self._missing[key] = time.monotonic()
+            return
+        pixmap = QPixmap.fromImage(image) # QPixmap can only be made on the GUI thread
+        self._pixmaps[key] = pixmap
+        self.used_bytes += self._cost(pixmap)
+        while self.used_bytes > self.max_bytes and len(self._pixmaps) > 1:
+            _, evicted = self._pixmaps.popitem(last=False)
+            self.used_bytes -= self._cost(evicted)
+        self.thumbnail_ready.emit(path, size)
+
+    def shutdown(self):
+        self._pool.clear()
+        self._pool.waitForDone()
@@ -0,0 +1,199 @@
+"""
+View Models Module
+Qt item models that read straight from the library instead of copying every song into widgets.
+"""
+from collections import deque
+from PySide6.QtCore import Qt, QAbstractTableModel, QAbstractListModel, QModelIndex
+from PySide6.QtGui import QBrush, QColor
+
+from music_library import _format_duration
+
+COLUMNS = ["#", "Title", "Artist", "Album", "🕒"]
+SORT_BY_COLUMN = ["track", "title", "artist", "album", "duration"] # music_library.SORT_KEYS for each column
+DEFAULT_SORT_COLUMN = 2
+MAX_DELTA_ROWS = 100 # Bigger library changes are cheaper to show with a full reset than row by row
+TITLE_BRUSH = QBrush(QColor("#E3F2FD")) # Shared by every row
+
+class SongTableModel(QAbstractTableModel):
+    """
+    Table model over a list of Song objects.
+    Cell text is only produced in data(), so Qt only asks for the rows that are on screen.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._songs = []
+
+    def set_songs(self, songs):
+        self.beginResetModel()
+        self._songs = songs
+        self.endResetModel()
+
+    def songs(self):
+        return self._songs
+
+    def append_songs(self, songs):
+        """Adds rows at the end, unsorted. Used while loading, a full set_songs() follows."""
+        if not songs: return
+        self.beginInsertRows(QModelIndex(), len(self._songs), len(self._songs) + len(songs) - 1)
+        self._songs.extend(songs)
+        self.endInsertRows()
+
+    def apply_change(self, change, key, reverse=False, belongs=None):
+        """
+        Applies a music_library.LibraryChange to a list kept sorted by key, one row at a time, so the
+        scroll position and selection survive. belongs(song) says whether a song should be in this list
+        (None: every song). Returns False without touching anything if the change is too big for that.
+        """
+        if len(change) > MAX_DELTA_ROWS: return False
+        for song in change.removed:
+            row = self._find(song, key, reverse)
+            if row is not None: self._remove_row(row)
+        for song in change.updated:
+            row = self._find(song, key, reverse)
+            wanted = belongs is None or belongs(song)
+            if row is None:
+                if wanted: self._insert_row(song, key, reverse)
+            elif not wanted: self._remove_row(row)
+            else: self._move_row(row, key, reverse)
+        for song in change.added:
+            if belongs is None or belongs(song): self._insert_row(song, key, reverse)
+        return True
+
+    def _position(self, song, key, reverse):
+        # Where song goes in the sorted list, after any equal keys
+        wanted = key(song)
+        songs = self._songs
+        lo, hi = 0, len(songs)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            other = key(songs[mid])
+            if (other >= wanted) if reverse else (other <= wanted): lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def _find(self, song, key, reverse):
+        # Fields of an updated song changed, so its key may not lead to it; fall back to a scan
+        row = self._position(song, key, reverse) - 1
+        while row >= 0 and self._songs[row] is not song and key(self._songs[row]) == key(song): row -= 1
+        if row >= 0 and self._songs[row] is song: return row
+        try:
+            return self._songs.index(song)
+        except ValueError:
+            return None
+
+    def _insert_row(self, song, key, reverse):
+        row = self._position(song, key, reverse)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._songs.insert(row, song)
+        self.endInsertRows()
+
+    def _remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._songs[row]
+        self.endRemoveRows()
+
+    def _move_row(self, row, key, reverse):
+        song = self._songs.pop(row)
+        new_row = self._position(song, key, reverse)
+        self._songs.insert(row, song)
+        if new_row != row:
+            # Qt wants the destination as the row the item lands *before*, counted before the move
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), new_row + 1 if new_row > row else new_row)
+            del self._songs[row]
+            self._songs.insert(new_row, song)
+            self.endMoveRows()
+        self.dataChanged.emit(self.index(new_row, 0), self.index(new_row, len(COLUMNS) - 1))
+
+    def song_at(self, row):
+        if 0 <= row < len(self._songs): return self._songs[row]
+        return None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        return len(self._songs)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        return len(COLUMNS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        song = self._songs[index.row()]
+        col = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == 0: return str(song.track_number)
+            if col == 1: return song.title
+            if col == 2: return song.artist
+            if col == 3: return song.album
+            if col == 4: return _format_duration(song.duration)
+        elif role == Qt.ItemDataRole.UserRole:
+            return song
+        elif role == Qt.ItemDataRole.TextAlignmentRole:
+            if col == 0: return Qt.AlignmentFlag.AlignCenter
+        elif role == Qt.ItemDataRole.ForegroundRole:
+            if col == 1: return TITLE_BRUSH
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return COLUMNS[section]
+        return None
+
+class QueueListModel(QAbstractListModel):
+    """
+    Mirror of the player's queue for the "Up Next" list.
+    Connect it to the AudioPlayer queue_* signals; each change only touches the rows involved.
+    """
+    def __init__(self, player=None, parent=None):
+        super().__init__(parent)
+        self._songs = deque()
+        if player is not None:
+            player.queue_reset.connect(self.reset_queue)
+            player.queue_inserted.connect(self.insert_songs)
+            player.queue_removed.connect(self.remove_songs)
+            player.queue_moved.connect(self.move_song)
+            self.reset_queue(player.queue)
+
+    def reset_queue(self, songs):
+        self.beginResetModel()
+        self._songs = deque(songs)
+        self.endResetModel()
+
+    def insert_songs(self, first, songs):
+        if not songs: return
+        self.beginInsertRows(QModelIndex(), first, first + len(songs) - 1)
+        if first == 0: self._songs.extendleft(reversed(songs))
+        elif first >= len(self._songs): self._songs.extend(songs)
+        else:
+            for offset, song in enumerate(songs): self._songs.insert(first + offset, song)
+        self.endInsertRows()
+
+    def remove_songs(self, first, count):
+        if count <= 0: return
+        self.beginRemoveRows(QModelIndex(), first, first + count - 1)
+        if first == 0 and count == len(self._songs): self._songs.clear()
+        elif first == 0:
+            for _ in range(count): self._songs.popleft()
+        else:
+            for _ in range(count): del self._songs[first]
+        self.endRemoveRows()
+
+    def move_song(self, from_row, to_row):
+        # Qt wants the destination as the row the item lands *before*, counted before the move
+        destination = to_row + 1 if to_row > from_row else to_row
+        self.beginMoveRows(QModelIndex(), from_row, from_row, QModelIndex(), destination)
+        song = self._songs[from_row]
+        del self._songs[from_row]
+        self._songs.insert(to_row, song)
+        self.endMoveRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        return len(self._songs)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        song = self._songs[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole: return f"{song.title} • {song.artist}"
+        if role == Qt.ItemDataRole.UserRole: return song
+        return None